@@ -5,7 +5,28 @@ import csv
 import itertools
 import sys
 import argparse
-import pickle
+from concurrent.futures import ProcessPoolExecutor
+from ast_store import AstStore, PickleStore, open_store, source_key, write_object, write_bytes, save_locations
+
+# statement lists a collectable test can sit in: module and class bodies plus if/try/with/for blocks
+SCOPE_FIELDS = ("body", "orelse", "handlers", "finalbody")
+
+def function_locations(tree):
+    # "CLS.TST" -> [[field, index], ...] from the module down to each def pytest could collect;
+    # nested classes are dotted ("Outer.Inner") and function bodies are not entered
+    locations = {}
+    def walk(node, cls, steps):
+        for field in SCOPE_FIELDS:
+            for i, child in enumerate(getattr(node, field, None) or ()):
+                here = steps + [[field, i]]
+                if isinstance(child, ast.ClassDef):
+                    walk(child, f"{cls}.{child.name}" if cls else child.name, here)
+                elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    locations[f"{cls}.{child.name}"] = here
+                else:
+                    walk(child, cls, here)
+    walk(tree, "", [])
+    return locations
 
 class AssertionMiner(ast.NodeVisitor):
     def __init__(self, filepath: str, source_text: str):
@@ -18,7 +39,7 @@ class AssertionMiner(ast.NodeVisitor):
 
     def visit_ClassDef(self, node: ast.ClassDef):
         prev_class = self.current_class
-        self.current_class = node.name
+        self.current_class = f"{prev_class}.{node.name}" if prev_class else node.name
         self.generic_visit(node)
         self.current_class = prev_class
 
@@ -28,6 +49,8 @@ class AssertionMiner(ast.NodeVisitor):
         self.current_function = node.name
         self.generic_visit(node)
         self.current_function = prev_function
+
+    visit_AsyncFunctionDef = visit_FunctionDef
     
     def visit_Assert(self, node: ast.Assert):
         test = node.test
@@ -96,40 +119,98 @@ class AssertionMiner(ast.NodeVisitor):
                             node.lineno, snippet))
         self.generic_visit(node)
 
-def compile_project(LINK, TARGET, test_dirs):
-    if Path(TARGET).exists():
-        raise FileExistsError(f"'{TARGET}' already exists.")
-    cmd = ['git','clone',LINK,TARGET]
-    subprocess.run(cmd, check=True, text=True)
-    py_trees = {}
+def parse_file(path, store_root):
+    data = Path(path).read_bytes()
+    key = source_key(data)
+    store = AstStore(store_root)
+    if not store.source_path(key).exists():
+        write_bytes(store.source_path(key), data)
+    if store.object_path(key).exists():
+        return path, key, True
+    write_object(store.object_path(key), ast.parse(data.decode(), filename=path))
+    return path, key, False
+
+def clone_project(LINK, TARGET):
+    if not Path(TARGET).exists():
+        subprocess.run(['git','clone',LINK,TARGET], check=True, text=True)
+        return
+    origin = subprocess.run(['git','-C',TARGET,'remote','get-url','origin'], capture_output=True, text=True)
+    if origin.returncode != 0 or origin.stdout.strip() != LINK:
+        raise FileExistsError(f"'{TARGET}' already exists and is not a clone of {LINK}.")
+    print(f"Reusing existing clone {TARGET}")
+
+def compile_project(LINK, TARGET, test_dirs, store_root, max_workers=None):
+    clone_project(LINK, TARGET)
+    paths = []
     for test_dir in test_dirs:
         root = Path(TARGET) / test_dir
         for path in root.rglob('*'):
             if path.is_file() and path.suffix == ".py":
-                py_trees[str(path)] = ast.parse(path.read_text(),filename=str(path))
-    return py_trees
-
-def mine_file(PATH: str, TREE: ast.Module):
-    source_text = open(PATH).read()
+                paths.append(str(path))
+    store = AstStore(store_root)
+    store.entries = {}
+    reused = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for path, key, hit in executor.map(parse_file, paths, itertools.repeat(store_root), chunksize=16):
+            store.entries[path] = key
+            reused += hit
+    store.save()
+    removed = store.prune()
+    print(f"Parsed {len(paths) - reused} files, reused {reused}, dropped {removed} stale")
+    return store
+
+def mine_file(PATH: str, TREE: ast.Module, source_text=None):
+    if source_text is None:
+        source_text = open(PATH).read()
     finder = AssertionMiner(PATH, source_text)
     finder.visit(TREE)
-    return finder.rows, finder.function_defs
+    return finder.rows, finder.function_defs, function_locations(TREE)
+
+_stores = None
+
+def open_mine_stores(store_root, reparse, funcs_out):
+    global _stores
+    _stores = (AstStore(store_root, reparse=reparse, cache_size=1), PickleStore(funcs_out))
+
+def mine_entry(path):
+    asts, funcs = _stores
+    rows, function_defs, locations = mine_file(path, asts[path], asts.source(path))
+    return rows, funcs.put(path, function_defs), locations
 
-def mine_project(ast_dict, CSV_TARGET, target_folder):
+def mine_project(ast_dict, CSV_TARGET, target_folder, funcs_out=None, max_workers=None):
     paths = list(ast_dict)
     if target_folder:
         paths = [
             p for p in paths
             if p.split('/', 2)[1] == target_folder
         ]
-    mines = [mine_file(path, ast_dict[path]) for path in paths]
-    rows   = [result_rows for (result_rows, _) in mines]
-    funcs = { path: mines[i][1] for i, path in enumerate(paths) }
-    flat_rows = list(itertools.chain.from_iterable(rows))
+    funcs = PickleStore(funcs_out) if funcs_out else {}
+    if funcs_out:
+        funcs.entries = {}
+    locations = {}
     with open(CSV_TARGET, "w", newline="") as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(["filepath", "testclass", "testname", "assertion_type", "line_number", "assert_string"])
-        writer.writerows(flat_rows)
+        if isinstance(ast_dict, AstStore) and funcs_out:
+            # workers load their own trees and write the funcs objects; only rows come back
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=open_mine_stores,
+                                     initargs=(ast_dict.root, ast_dict.reparse, funcs_out)) as executor:
+                for path, (file_rows, name, file_locations) in zip(paths, executor.map(mine_entry, paths, chunksize=8)):
+                    writer.writerows(file_rows)
+                    funcs.entries[path] = name
+                    locations[path] = file_locations
+        else:
+            for path in paths:
+                file_rows, function_defs, locations[path] = mine_file(path, ast_dict[path])
+                writer.writerows(file_rows)
+                if funcs_out:
+                    funcs.put(path, function_defs)
+                else:
+                    funcs[path] = function_defs
+    if funcs_out:
+        funcs.save()
+        funcs.prune()
+        save_locations(funcs_out, locations)
     return funcs
 
 if __name__ == "__main__":
@@ -140,13 +221,18 @@ if __name__ == "__main__":
     c.add_argument("--project-link", required=True)
     c.add_argument("--test-dirs", required=False, default=None)
     c.add_argument("--clone-dir", required=True)
-    c.add_argument("--asts-out", required=True)
+    c.add_argument("--asts-out", required=True,
+                   help="AST store directory; re-compiling into it only parses changed files")
+    c.add_argument("--workers", required=False, default=None, type=int)
 
     m = sub.add_parser("mine", help="Mine assertions from ASTs")
     m.add_argument("--asts-in", required=True)
+    m.add_argument("--reparse", action="store_true",
+                   help="Parse the source files instead of loading the stored ASTs")
     m.add_argument("--test-dir", required=True)
     m.add_argument("--csv-target", required=True)
     m.add_argument("--funcs-out", required=True)
+    m.add_argument("--workers", required=False, default=None, type=int)
 
     args = p.parse_args()
 
@@ -154,15 +240,15 @@ if __name__ == "__main__":
         dirs = [""]
         if args.test_dirs:
             dirs = [dir.strip() for dir in args.test_dirs.split(',')]
-        asts = compile_project(args.project_link, args.clone_dir, test_dirs=dirs)
-        with open(args.asts_out, "wb") as f: pickle.dump(asts, f)
+        asts = compile_project(args.project_link, args.clone_dir, test_dirs=dirs, store_root=args.asts_out,
+                               max_workers=args.workers)
         print(f"ASTs → {args.asts_out}, project → {args.clone_dir}")
 
 
     elif args.cmd == "mine":
-        with open(args.asts_in, "rb") as f: asts = pickle.load(f)
-        funcs = mine_project(asts, args.csv_target, target_folder=args.test_dir)
-        with open(args.funcs_out, "wb") as f: pickle.dump(funcs, f)
+        asts = open_store(args.asts_in, reparse=args.reparse)
+        funcs = mine_project(asts, args.csv_target, target_folder=args.test_dir, funcs_out=args.funcs_out,
+                             max_workers=args.workers)
         print(f"Assertions CSV → {args.csv_target}, Funcs → {args.funcs_out}")
 
     
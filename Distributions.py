@@ -1,80 +1,22 @@
-import matplotlib.pyplot as plt
 import sys
-from Sampler import run_pytest
-import re
+from Sampler import run_pytest, BACKENDS
+from Scheduler import TrialGroup, cpu_budget, run_groups, thread_count
+from cache_utils import ResultCache
+from metric_channel import pairs_by_assertion, records_by_rep
+from online_stats import STATS_FILE, RunningStats, converged, exact_quantile, ks_2samp, save_stats
+from result_store import ResultStore
+from Seeder import seed_api_list
 import argparse
+from bisect import insort
 from pathlib import Path
-import warnings
-from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
-from pandas import read_csv
+from pandas import DataFrame, read_csv
 import time
 
-_ansi = re.compile(r'\x1b\[[0-9;]*m')
-
-# _num = re.compile(r'[-+]?(?:\d*\.\d+|\d+)')
-_num = re.compile(r'''           
-     [-+]?(?:\d*\.\d+|\d+)
-     (?:[eE][-+]?\d+)?
-''', re.VERBOSE)
-
-def expected_pairs(stdout):
-    full = " ".join(_ansi.sub("", line) for line in stdout)
-
-    m_pass = re.search(r'(\d+)\s+passed', full)
-    m_fail = re.search(r'(\d+)\s+failed', full)
-
-    passed = int(m_pass.group(1)) if m_pass else 0
-    failed = int(m_fail.group(1)) if m_fail else 0
-
-    total = passed + failed
-    return total
-
-def parse_output(stdout):
-    nums = []
-    exp = expected_pairs(stdout)
-    if exp == 0:
-        warnings.warn("expected_pairs returned 0", UserWarning, stacklevel=2)
-    for line in stdout:
-        text = _ansi.sub("", line).strip()
-        if not text or text == ".":
-            continue
-
-        if "FLAKY_METRIC:" in text:
-            matches = _num.findall(text)
-            if len(matches) != 1:
-                raise RuntimeError("Expected exactly one FLAKY_METRIC value", line)
-            nums.append(float(matches[0]))
-            continue
-            
-        low = text.lower()
-        if any(keyword in low for keyword in ("passed", "failed", "skipped")):
-            continue
-
-    if len(nums) % 2 != 0:
-        raise RuntimeError("Even number of pairs", nums)
-    pairs = [(nums[i], nums[i+1]) for i in range(0, len(nums), 2)]
-    if len(pairs) != exp:
-        raise RuntimeError(f"Expected {exp} pairs, but parsed {len(pairs)}", nums)
-
-    return pairs
-
-def plot_distribution(data, bins=20, title='Distribution', xlabel='Value', ylabel='Frequency', expected=None):
-    fig, ax = plt.subplots()
-    ax.hist(data, bins=bins, edgecolor='black', alpha=0.75)
-    if expected is not None:
-        ax.axvline(expected, color='red', linestyle='--', linewidth=2, label=f'Expected = {expected}', zorder=5)
-        ax.legend()
-    ax.set_title(title)
-    ax.set_xlabel(xlabel)
-    ax.set_ylabel(ylabel)
-    return fig, ax
-
 def do_trial(test_input, safeguard=3):
     err = None
     for _ in range(safeguard):
         try:
-            warnings.simplefilter("always")
             pkg = run_pytest(
                 LOGGED_PATH   = test_input["LOGGED_PATH"],
                 CLASS         = test_input["CLASS"],
@@ -83,78 +25,241 @@ def do_trial(test_input, safeguard=3):
                 seed_value    = test_input["seed_value"],
                 seed_config_name = test_input["seed_config_name"],
                 seed_config_file = test_input["seed_config_file"],
+                backend       = test_input.get("backend", "subprocess"),
+                timeout       = test_input.get("timeout", 180),
+                param_indices = test_input.get("param_indices"),
+                instrument_lines = test_input.get("instrument"),
+                strip_seeds   = test_input.get("strip_seeds"),
+                timing        = test_input.get("timing", False),
+                repeat        = test_input.get("repeat") or 1,
+                cpus          = test_input.get("cpus"),
             )
-            with warnings.catch_warnings(record=True) as caught:
-                pairs = parse_output(pkg["stdout"])
-            for w in caught:
-                if issubclass(w.category, UserWarning) and "expected_pairs returned 0" in str(w.message):
-                    raise RuntimeError("No data is being recorded", pkg)
+            # with "repeat" the session ran that many trials, returned as one pairs dict each; the
+            # repetitions that recorded nothing (e.g. after a timeout) are left out
+            results = []
+            for records in records_by_rep(pkg["metrics"], test_input.get("repeat") or 1):
+                pairs = pairs_by_assertion(records, test_input.get("default_line", -1))
+                if test_input.get("lines"):
+                    # a batch-instrumented module also records the assertions this group does not sample
+                    pairs = {k: v for k, v in pairs.items() if k[0] in test_input["lines"]}
+                if pairs:
+                    results.append(pairs)
+            if not results and pkg["returncode"] == 0:
+                raise RuntimeError("No data is being recorded", pkg)
 
-            if pkg["returncode"] != 0 and not pairs:
+            if not results:
                 raise RuntimeError("Runtime test failure", pkg)
-            return pairs
+            return results if test_input.get("repeat") else results[0]
         except Exception as e:
             err = e
     raise RuntimeError("All safeguards failed.", err)
 
 
-def sample_test(test_input, foldername=None, trials=100, max_workers=4, show_plot=False, save_plot=False):
+def check_convergence(stats, ordered, expected, history, adaptive):
+    # the sketch's quantiles are only accurate relative to the values' magnitude, far coarser than the
+    # spread of a low-variance metric, so the quartiles compared in units of the std are exact ones,
+    # read from the series kept sorted as trials arrive
+    active = set()
+    for i, running in stats.items():
+        current = running.summary(expected[i])
+        current["q25"], current["q75"] = exact_quantile(ordered[i], 0.25), exact_quantile(ordered[i], 0.75)
+        previous, streak = history.get(i, (None, 0))
+        if running.n >= adaptive["min_trials"] and converged(previous, current, adaptive["tolerance"]):
+            streak += 1
+        else:
+            streak = 0
+        history[i] = (current, streak)
+        if streak < adaptive["patience"]:
+            active.add(i)
+    return active
+
+def per_line(series):
+    out = {}
+    for (line, i), value in sorted(series.items()):
+        out.setdefault(line, {})[i] = value
+    return out
+
+class DistributionGroup(TrialGroup):
+    # series are keyed by (assertion line, parametrization); a batch-instrumented test
+    # feeds every one of its assertions from the same trial
+    def __init__(self, key, test_input, trials=100, foldername=None, adaptive=None, store=None, text=False, repeat=1):
+        log_path = str(Path(foldername) / "data" / "trials.jsonl") if foldername else None
+        super().__init__(key, dict(test_input), trials, test_input["LOGGED_PATH"], log_path)
+        self.foldername = foldername
+        self.adaptive = adaptive
+        self.store = store
+        self.text = text
+        self.repeat = repeat
+        self.values = {}
+        self.ordered = {}
+        self.expected = {}
+        self.stats, self.history = {}, {}
+        self.active = None
+        self.batch = len(test_input.get("lines") or ()) > 1
+
+    def stopped(self):
+        return self.adaptive is not None and self.active is not None and not self.active
+
+    def next_input(self):
+        test_input = dict(self.test_input)
+        if self.repeat > 1:
+            test_input["repeat"] = min(self.repeat, self.trials - self.submitted)
+        return test_input
+
+    def add(self, pairs):
+        for series, (left, right) in sorted(pairs.items()):
+            self.values.setdefault(series, []).append(left)
+            if self.adaptive:
+                insort(self.ordered.setdefault(series, []), left)
+            self.expected.setdefault(series, right)
+            self.stats.setdefault(series, RunningStats()).add(left)
+        if self.adaptive and self.completed % self.adaptive["check_every"] == 0:
+            self.active = check_convergence(self.stats, self.ordered, self.expected, self.history, self.adaptive)
+            # parametrizations whose assertions all converged are deselected, so later trials only run the wide ones
+            self.test_input["param_indices"] = sorted({i for _, i in self.active})
+
+    def encode(self, pairs):
+        return [[line, i, left, right] for (line, i), (left, right) in sorted(pairs.items())]
+
+    def decode(self, entry):
+        # logs written before assertions were tagged hold [i, left, right]
+        default_line = self.test_input.get("default_line", -1)
+        pairs = {}
+        for e in entry:
+            line, i = (e[0], e[1]) if len(e) == 4 else (default_line, e[0])
+            pairs[(int(line), int(i))] = (e[-2], e[-1])
+        return pairs
+
+    def results(self):
+        # {line: {i: ...}} for a batch of assertions, {i: ...} for a single one
+        values, expected = per_line(self.values), per_line(self.expected)
+        if self.batch:
+            return values, expected
+        return next(iter(values.values()), {}), next(iter(expected.values()), {})
+
+    def series_folder(self, line):
+        folder = Path(self.foldername)
+        if not self.batch:
+            return folder
+        return folder.parent.parent / f"{self.test_input['TEST']}_{line}" / folder.name
+
+    def finish(self):
+        values, expected = self.values, self.expected
+        if not values:
+            raise RuntimeError("Sanity check failed.", values, expected)
+        counts = ", ".join(f"{line}/{i}: {len(v)}" if self.batch else f"{i}: {len(v)}"
+                           for (line, i), v in sorted(values.items()))
+        print(f"\nFinished {self.key}: {self.completed}/{self.trials} trials, per parametrization: {counts}")
+        expected_per_line = per_line(expected)
+        for line, line_values in per_line(values).items():
+            line_expected = expected_per_line[line]
+            folder = Path(self.series_folder(line)) if self.foldername else None
+            if folder:
+                store = self.store or ResultStore(folder.parent.parent)
+                store.write_group(folder.parent.name, folder.name, line_values, line_expected)
+                (folder / "data").mkdir(parents=True, exist_ok=True)
+                save_stats(folder / "data" / STATS_FILE, {i: self.stats[(line, i)] for i in line_values}, line_expected)
+                if self.text:
+                    data_path = folder / "data"
+                    data_path.mkdir(parents=True, exist_ok=True)
+                    for i, parametrization in sorted(line_values.items()):
+                        with open(data_path / f"_{line_expected[i]}_{i}.txt", 'w') as f:
+                            for x in parametrization:
+                                f.write(f"{x:.10f}\n")
+
+def sample_test(test_input, foldername=None, trials=100, max_workers=4, preload=(), adaptive=None, resume=False,
+                plot=False):
     max_workers = max_workers or os.cpu_count()
-    values = None
-    expected = None
-    
+    group = DistributionGroup(test_input["TEST"], test_input, trials, foldername, adaptive)
     print(f"Sampling {test_input['TEST']}...")
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(do_trial, test_input) for _ in range(trials)]
-        for r, future in enumerate(as_completed(futures), start=1):
-            try:
-                pairs = future.result()
-            except RuntimeError as e:
-                raise RuntimeError(f"Trial {r} failed", e)
-
-            if values is None:
-                values   = [[] for _ in range(len(pairs))]
-            if expected is None:
-                expected = [pair[1] for pair in pairs]
-            for i, pair in enumerate(pairs):
-                values[i].append(pair[0])
-            print(r, end=", ", flush=True)
-
-    if len(values) != len(expected):
-        raise RuntimeError("Sanity check failed.", values, expected)
-    for i, parametrization in enumerate(values):
-        figure = plot_distribution(parametrization, title=str(i), expected=expected[i])
-        if show_plot:
-            figure[0].show()
-        if foldername:
-            temp = f"_{expected[i]}_{i}"
-            if save_plot:
-                plot_path = Path(foldername) / "plot"
-                plot_path.mkdir(parents=True, exist_ok=True)
-                figure[0].savefig(plot_path / f"{temp}.png")
-            data_path = Path(foldername) / "data"
-            data_path.mkdir(parents=True, exist_ok=True)
-            with open(data_path / f"{temp}.txt", 'w') as f:
-                for x in parametrization:
-                    f.write(f"{x:.10f}\n")
-    return (values, expected)
-
-def test_line(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials=100, max_workers=4):
-    test_input = {'LOGGED_PATH' : tup.logged_path, 'CLASS' : tup.testclass, 'TEST' : tup.testname, 'repo_name' : repo_name, 
-                  'seed_value' : seed_value, 'seed_config_file' : seed_config_file}
-    path = out_name + "/" + tup.testname + "_" + str(tup.line_number) + "/"
-    output = {}
+    run_groups([group], do_trial, test_input.get("backend", "subprocess"), max_workers, test_input["repo_name"], preload,
+               resume=resume)
+    if group.error is not None:
+        raise group.error
+    if plot and foldername:
+        from Plotter import render
+        render(Path(foldername).parent.parent, max_workers)
+    return group.results()
+
+def line_groups(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials=100,
+                backend="subprocess", timeout=180, adaptive=None, store=None, text=False, lines=None,
+                instrument=None, strip_seeds=None, timing=False, repeat=1):
+    # lines: every assertion of the test instrumented in tup.logged_path (batch mode)
+    # instrument: lines of tup.filepath to instrument on import instead of running tup.logged_path
+    lines = sorted(lines or [int(tup.line_number)])
+    test_input = {'LOGGED_PATH' : tup.filepath if instrument else tup.logged_path, 'CLASS' : tup.testclass,
+                  'TEST' : tup.testname, 'repo_name' : repo_name, 
+                  'seed_value' : seed_value, 'seed_config_file' : seed_config_file, 'backend' : backend,
+                  'timeout' : timeout, 'lines' : lines, 'default_line' : lines[0] if len(lines) == 1 else -1}
+    if instrument:
+        test_input['instrument'] = sorted(instrument)
+    if strip_seeds:
+        test_input['strip_seeds'] = sorted(strip_seeds)
+    if timing:
+        test_input['timing'] = True
+    if len(lines) == 1:
+        name = tup.testname + "_" + str(lines[0])
+    else:
+        name = tup.testname + "_" + str(lines[0]) + "-" + str(lines[-1])
+    groups = []
     for seed_config_name in seed_config_names:
-        print(f"\nConfig {seed_config_name}")
         test_input['seed_config_name'] = seed_config_name
-        temp = path + "SEEDS_" + seed_config_name.replace(", ", "_")
-        try:
-            pack = sample_test(test_input, foldername=temp, trials=trials, max_workers=max_workers, show_plot=False, save_plot=True)
-        except RuntimeError as e:
-            raise RuntimeError("Config failed", seed_config_name, e)
-        output[seed_config_name] = pack
+        key = name + "/SEEDS_" + seed_config_name.replace(", ", "_")
+        groups.append(DistributionGroup(key, test_input, trials, foldername=out_name + "/" + key,
+                                        adaptive=adaptive, store=store, text=text, repeat=repeat))
+    return groups
+
+def test_line(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials=100, max_workers=4,
+              backend="subprocess", preload=(), timeout=180, adaptive=None, resume=False,
+              cache=None, text=False, lines=None, instrument=None, strip_seeds=None, timing=False, repeat=1):
+    groups = line_groups(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials,
+                         backend, timeout, adaptive, ResultStore(out_name), text, lines, instrument, strip_seeds,
+                         timing, repeat)
+    run_groups(groups, do_trial, backend, max_workers or os.cpu_count(), repo_name, preload, resume=resume, cache=cache)
+    output = {}
+    for seed_config_name, group in zip(seed_config_names, groups):
+        if group.error is not None:
+            raise RuntimeError("Config failed", seed_config_name, group.error)
+        output[seed_config_name] = group.results()
     return output
 
+def per_trial_seconds(group):
+    fresh = group.completed - group.resumed
+    return group.seconds / fresh if fresh else float("nan")
+
+def validate_repeat(isolated, repeated, alpha=0.01, dir_out=None):
+    # KS-tests every series sampled K trials per session against the same series sampled one trial
+    # per session; an assertion is safe to repeat when none of its series differ at level alpha
+    rows = []
+    unsafe = set()
+    for base, rep in zip(isolated, repeated):
+        test = base.test_input["TEST"]
+        if base.error is not None or rep.error is not None:
+            print(f"Cannot validate {base.key}: sampling failed")
+            unsafe.update((test, line) for line in base.test_input["lines"])
+            continue
+        speedup = per_trial_seconds(base) / per_trial_seconds(rep)
+        for series in sorted(set(base.values) | set(rep.values)):
+            a, b = base.values.get(series, []), rep.values.get(series, [])
+            d, p_value = ks_2samp(a, b)
+            safe = p_value >= alpha
+            if not safe:
+                unsafe.add((test, series[0]))
+            rows.append({"group": base.key, "line": series[0], "param": series[1], "n_isolated": len(a),
+                         "n_repeated": len(b), "mean_isolated": sum(a) / len(a) if a else float("nan"),
+                         "mean_repeated": sum(b) / len(b) if b else float("nan"), "ks_stat": d,
+                         "p_value": p_value, "safe": safe, "speedup": speedup})
+    assertions = sorted({(base.test_input["TEST"], line) for base in isolated for line in base.test_input["lines"]})
+    safe_ids = [f"{test}_{line}" for test, line in assertions if (test, line) not in unsafe]
+    print(f"\n{len(safe_ids)} of {len(assertions)} assertions are safe to repeat in one session (alpha={alpha})")
+    if dir_out:
+        report = Path(dir_out) / "repeat_validation.csv"
+        DataFrame(rows).to_csv(report, index=False)
+        with open(Path(dir_out) / "repeat_safe.txt", "w") as f:
+            f.writelines(f"{assertion}\n" for assertion in safe_ids)
+        print(f"Saved: {report}")
+    return rows, safe_ids
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser(description="Distributions CLI")
     sub = p.add_subparsers(dest="cmd", required=True)
@@ -169,6 +274,53 @@ if __name__ == "__main__":
     c.add_argument("--seed-value", required=True)
     c.add_argument("--seed-config-file-in", required=True)
     c.add_argument("--seed-config-names", required=True)
+    c.add_argument("--backend", default="subprocess", choices=BACKENDS, required=False)
+    c.add_argument("--preload", default="", required=False,
+                   help="Comma-separated modules warm workers import once (e.g. torch,pyro)")
+    c.add_argument("--timeout", default=180, type=int, required=False, help="Per-trial timeout in seconds")
+    c.add_argument("--adaptive", action="store_true",
+                   help="Sample each parametrization until its statistics converge; --trials becomes the cap")
+    c.add_argument("--tolerance", default=0.05, type=float, required=False,
+                   help="Largest change (in standard deviations) between checks that still counts as converged")
+    c.add_argument("--min-trials", default=30, type=int, required=False)
+    c.add_argument("--check-every", default=None, type=int, required=False,
+                   help="Trials between convergence checks (default: max(10, workers))")
+    c.add_argument("--patience", default=3, type=int, required=False,
+                   help="Consecutive converged checks before a parametrization stops")
+    c.add_argument("--durations", default=None, required=False,
+                   help="Per-trial duration history used to schedule the longest tests first "
+                        "(default: <dir-out>/durations.json)")
+    c.add_argument("--resume", action="store_true",
+                   help="Keep the trials already logged under --dir-out and only run the remainder")
+    c.add_argument("--text", action="store_true",
+                   help="Also write the per-parametrization .txt files next to the binary store")
+    c.add_argument("--cache-dir", default=None, required=False,
+                   help="Trial cache shared across runs; unchanged tests reuse (and top up) their cached trials")
+    c.add_argument("--cache-max-mb", default=1024, type=float, required=False,
+                   help="Least recently used cache entries are evicted beyond this size")
+    c.add_argument("--in-memory", action="store_true",
+                   help="Instrument the original test files on import instead of running the logged_path copies")
+    c.add_argument("--strip-seeds", default=None, type=seed_api_list, required=False,
+                   help="Comma-separated seeding APIs (or 'all') to strip on import instead of running Seeder.py")
+    c.add_argument("--timing", action="store_true",
+                   help="Record per-phase durations and peak RSS of every trial (data/timing.jsonl, "
+                        "summarized by phase_timing.py report)")
+    c.add_argument("--cores", default=None, type=int, required=False,
+                   help="CPU budget: pin every trial to its own CPUs out of the first N this job may use "
+                        "(0: all of them); --workers is then derived from --threads")
+    c.add_argument("--threads", default="1", type=thread_count, required=False,
+                   help="Intra-op threads (and CPUs) per trial with --cores, or 'auto' to tune them per assertion "
+                        "from measured throughput")
+    c.add_argument("--plot", action="store_true",
+                   help="Render the distribution plots once sampling is done (same as Plotter.py render)")
+    c.add_argument("--repeat", default=1, type=int, required=False,
+                   help="Trials run per pytest session (the test is repeated in-process, reseeded each time); "
+                        "only for tests whose module-level state is safe to share, see --validate-repeat")
+    c.add_argument("--validate-repeat", action="store_true",
+                   help="Sample every assertion both one trial per session (<dir-out>/isolated) and --repeat "
+                        "trials per session (<dir-out>/repeat_<K>), and KS-test the distributions against each other")
+    c.add_argument("--alpha", default=0.01, type=float, required=False,
+                   help="Significance level below which --validate-repeat calls a series unsafe to repeat")
     
     args = p.parse_args()
 
@@ -178,18 +330,60 @@ if __name__ == "__main__":
     if args.cmd == "sample_csv":
         t1 = time.time() / 60.0
         seed_configs = [s.strip() for s in args.seed_config_names.split(';') if s.strip()]
+        preload = [s.strip() for s in args.preload.split(',') if s.strip()]
+        adaptive = None
+        if args.adaptive:
+            adaptive = {"tolerance": args.tolerance, "min_trials": args.min_trials, "patience": args.patience,
+                        "check_every": args.check_every or max(10, int(args.workers))}
         tests = read_csv(args.csv_in, keep_default_na=False)
         if args.assertions:
             ASSERTIONS = set(s.strip() for s in args.assertions.split(",") if s.strip())
             test_tups = [(idx, tup) for idx, tup in enumerate(tests.itertuples()) if assertion_id(tup) in ASSERTIONS]
         else:
             test_tups = list(enumerate(tests.itertuples()))
+        # assertions instrumented into the same module (Instrumentor log --batch) share their test's trials
+        per_test = {}
+        per_file = {}
         for t in test_tups:
             if not "test" in t[1].testname:
                 continue
-            print(f"\n|{t[0]}:{round((time.time() / 60.0) - t1, 2)}|__________Trying {t[1]}____________________")
-            try:
-                test_line(t[1], args.dir_out, args.repo_name, args.seed_value, args.seed_config_file_in, seed_configs, 
-                          int(args.trials), int(args.workers))
-            except Exception as e:
-                print(f"Skipping {t[0]}", str(e))
\ No newline at end of file
+            path = t[1].filepath if args.in_memory else t[1].logged_path
+            per_test.setdefault((path, t[1].testclass, t[1].testname), []).append(t)
+            # one instrumented module per file, so its tests share a zygote
+            per_file.setdefault(path, set()).add(int(t[1].line_number))
+
+        def queue(dir_out, repeat):
+            store = ResultStore(dir_out)
+            groups = []
+            for same_test in per_test.values():
+                t = same_test[0]
+                print(f"|{t[0]}| Queueing {t[1]}" + (f" and {len(same_test) - 1} more assertions" if len(same_test) > 1 else ""))
+                groups += line_groups(t[1], dir_out, args.repo_name, args.seed_value, args.seed_config_file_in, seed_configs,
+                                      int(args.trials), args.backend, args.timeout, adaptive, store, args.text,
+                                      lines=[int(u[1].line_number) for u in same_test],
+                                      instrument=per_file[t[1].filepath] if args.in_memory else None,
+                                      strip_seeds=args.strip_seeds, timing=args.timing, repeat=repeat)
+            return groups
+
+        if args.validate_repeat:
+            if args.repeat < 2 or adaptive:
+                p.error("--validate-repeat needs --repeat K > 1 and fixed --trials (no --adaptive)")
+            out_dirs = [str(Path(args.dir_out) / "isolated"), str(Path(args.dir_out) / f"repeat_{args.repeat}")]
+            isolated, repeated = queue(out_dirs[0], 1), queue(out_dirs[1], args.repeat)
+            groups = isolated + repeated
+        else:
+            out_dirs = [args.dir_out]
+            groups = queue(args.dir_out, args.repeat)
+        Path(args.dir_out).mkdir(parents=True, exist_ok=True)
+        run_groups(groups, do_trial, args.backend, int(args.workers) or os.cpu_count(), args.repo_name, preload,
+                   durations_path=args.durations or str(Path(args.dir_out) / "durations.json"), resume=args.resume,
+                   cache=ResultCache(args.cache_dir, args.cache_max_mb) if args.cache_dir else None,
+                   cpus=cpu_budget(args.cores) if args.cores is not None else None, threads=args.threads)
+        skipped = sum(group.error is not None for group in groups)
+        print(f"\nDone in {round((time.time() / 60.0) - t1, 2)} min, {skipped} of {len(groups)} groups skipped")
+        if args.validate_repeat:
+            validate_repeat(isolated, repeated, args.alpha, args.dir_out)
+        if args.plot:
+            from Plotter import render
+            for out_dir in out_dirs:
+                render(out_dir, int(args.workers) or None)
\ No newline at end of file
@@ -1,12 +1,15 @@
-import matplotlib.pyplot as plt
 import sys
-from Sampler import run_pytest
+from Sampler import run_pytest, BACKENDS
+from Scheduler import TrialGroup, cpu_budget, run_groups, thread_count
+from cache_utils import ResultCache
+from Seeder import seed_api_list
 import re
 import argparse
 from pathlib import Path
 import warnings
-from concurrent.futures import ProcessPoolExecutor, as_completed
 import os
+import json
+from statistics import NormalDist
 from pandas import read_csv
 import time
 
@@ -19,59 +22,133 @@ def do_trial(test_input):
         seed_value         = test_input.get("seed_value"),
         seed_config_name   = test_input.get("seed_config_name"),
         seed_config_file   = test_input.get("seed_config_file"),
+        backend            = test_input.get("backend", "subprocess"),
+        timeout            = test_input.get("timeout", 180),
+        strip_seeds        = test_input.get("strip_seeds"),
+        timing             = test_input.get("timing", False),
+        cpus               = test_input.get("cpus"),
     )
     if pkg["returncode"] in {0, 1}:
         return int(pkg["returncode"])
     else:
         raise RuntimeError(f"pytest exited with unexpected code {pkg['returncode']}", pkg)
 
+def wilson_interval(failures, n, confidence=0.95):
+    if n == 0:
+        return 0.0, 1.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    p = failures / n
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    half = z * ((p * (1 - p) / n + z * z / (4 * n * n)) ** 0.5) / denom
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+def should_stop(results, adaptive):
+    n = len(results)
+    if n < adaptive["min_trials"]:
+        return False
+    low, high = wilson_interval(sum(results), n, adaptive["confidence"])
+    if adaptive["precision"] is not None and (high - low) / 2 <= adaptive["precision"]:
+        return True
+    threshold = adaptive["threshold"]
+    return threshold is not None and (high < threshold or low > threshold)
+
+def summarize(results, trials, adaptive):
+    failures = sum(results)
+    confidence = adaptive["confidence"] if adaptive else 0.95
+    low, high = wilson_interval(failures, len(results), confidence)
+    return {
+        "trials": len(results),
+        "max_trials": trials,
+        "failures": failures,
+        "failure_rate": failures / len(results) if results else None,
+        "ci_low": low,
+        "ci_high": high,
+        "confidence": confidence,
+        "stopped_early": len(results) < trials,
+    }
+
+class FlakinessGroup(TrialGroup):
+    def __init__(self, key, test_input, trials=100, foldername=None, adaptive=None):
+        log_path = str(Path(foldername) / "data" / "trials.jsonl") if foldername else None
+        super().__init__(key, dict(test_input), trials, test_input["PATH"], log_path)
+        self.foldername = foldername
+        self.adaptive = adaptive
+        self.results = []
+
+    def stopped(self):
+        return self.adaptive is not None and should_stop(self.results, self.adaptive)
+
+    def add(self, passed):
+        self.results.append(passed)
+
+    def finish(self):
+        results = self.results
+        summary = summarize(results, self.trials, self.adaptive)
+        print(f"\nFinished {self.key}: spent {summary['trials']}/{self.trials} trials, "
+              f"failure rate {summary['failure_rate']} [{summary['ci_low']:.4f}, {summary['ci_high']:.4f}]")
+
+        if self.foldername:
+            data_dir = Path(self.foldername) / "data"
+            data_dir.mkdir(parents=True, exist_ok=True)
+            with open(data_dir / "results.txt", "w") as f:
+                for ok in results:
+                    f.write(f"{int(ok)}\n")
+            with open(data_dir / "summary.json", "w") as f:
+                json.dump(summary, f, indent=2)
+
 def sample_test(test_input,
                 foldername=None,
                 trials=100,
-                max_workers=4):
+                max_workers=4,
+                preload=(),
+                adaptive=None,
+                resume=False):
     max_workers = max_workers or os.cpu_count()
-    results = []
+    group = FlakinessGroup(test_input["TEST"], test_input, trials, foldername, adaptive)
 
     print(f"Sampling {test_input['TEST']}…")
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(do_trial, test_input)
-                   for _ in range(trials)]
-        for i, future in enumerate(as_completed(futures), start=1):
-            passed = future.result()
-
-            results.append(passed)
-            print(i, end=", ", flush=True)
-    print()
-
-    if foldername:
-        data_dir = Path(foldername) / "data"
-        data_dir.mkdir(parents=True, exist_ok=True)
-        with open(data_dir / "results.txt", "w") as f:
-            for ok in results:
-                f.write(f"{int(ok)}\n")
-
-    return results
-
-def test_line(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials=100, max_workers=4):
+    run_groups([group], do_trial, test_input.get("backend", "subprocess"), max_workers, test_input["repo_name"], preload,
+               resume=resume)
+    if group.error is not None:
+        raise group.error
+    return group.results
+
+def line_groups(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials=100,
+                backend="subprocess", timeout=180, adaptive=None, strip_seeds=None, timing=False):
     test_input = {
         'PATH'              : tup.filepath,
         'CLASS'             : tup.testclass,
         'TEST'              : tup.testname,
         'repo_name'         : repo_name,
         'seed_value'        : seed_value,
-        'seed_config_file'  : seed_config_file
+        'seed_config_file'  : seed_config_file,
+        'backend'           : backend,
+        'timeout'           : timeout
     }
-    path = out_name + "/" + tup.testname + "_" + str(tup.line_number) + "/"
-    output = {}
+    if strip_seeds:
+        test_input['strip_seeds'] = sorted(strip_seeds)
+    if timing:
+        test_input['timing'] = True
+    name = tup.testname + "_" + str(tup.line_number)
+    groups = []
     for cfg in seed_config_names:
-        print(f"\nConfig {cfg}")
         test_input['seed_config_name'] = cfg
-        temp = path + "SEEDS_" + cfg.replace(", ", "_")
-        results = sample_test(test_input,
-                              foldername=temp,
-                              trials=trials,
-                              max_workers=max_workers)
-        output[cfg] = results
+        key = name + "/SEEDS_" + cfg.replace(", ", "_")
+        groups.append(FlakinessGroup(key, test_input, trials, foldername=out_name + "/" + key, adaptive=adaptive))
+    return groups
+
+def test_line(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials=100, max_workers=4,
+              backend="subprocess", preload=(), timeout=180, adaptive=None, resume=False,
+              cache=None, strip_seeds=None, timing=False):
+    groups = line_groups(tup, out_name, repo_name, seed_value, seed_config_file, seed_config_names, trials,
+                         backend, timeout, adaptive, strip_seeds, timing)
+    run_groups(groups, do_trial, backend, max_workers or os.cpu_count(), repo_name, preload, resume=resume, cache=cache)
+    output = {}
+    for cfg, group in zip(seed_config_names, groups):
+        if group.error is not None:
+            raise group.error
+        output[cfg] = group.results
     return output
 
 if __name__ == "__main__":
@@ -88,6 +165,38 @@ if __name__ == "__main__":
     c.add_argument("--seed-value", required=True)
     c.add_argument("--seed-config-file-in", required=True)
     c.add_argument("--seed-config-names", required=True)
+    c.add_argument("--backend", default="subprocess", choices=BACKENDS, required=False)
+    c.add_argument("--preload", default="", required=False,
+                   help="Comma-separated modules warm workers import once (e.g. torch,pyro)")
+    c.add_argument("--timeout", default=180, type=int, required=False, help="Per-trial timeout in seconds")
+    c.add_argument("--adaptive", action="store_true",
+                   help="Stop sampling an assertion early; --trials becomes the cap")
+    c.add_argument("--precision", default=0.05, type=float, required=False,
+                   help="Stop once the failure-rate interval half-width is at most this")
+    c.add_argument("--threshold", default=None, type=float, required=False,
+                   help="Stop once the failure-rate interval lies entirely above or below this rate")
+    c.add_argument("--confidence", default=0.95, type=float, required=False)
+    c.add_argument("--min-trials", default=20, type=int, required=False)
+    c.add_argument("--durations", default=None, required=False,
+                   help="Per-trial duration history used to schedule the longest tests first "
+                        "(default: <dir-out>/durations.json)")
+    c.add_argument("--resume", action="store_true",
+                   help="Keep the trials already logged under --dir-out and only run the remainder")
+    c.add_argument("--cache-dir", default=None, required=False,
+                   help="Trial cache shared across runs; unchanged tests reuse (and top up) their cached trials")
+    c.add_argument("--cache-max-mb", default=1024, type=float, required=False,
+                   help="Least recently used cache entries are evicted beyond this size")
+    c.add_argument("--strip-seeds", default=None, type=seed_api_list, required=False,
+                   help="Comma-separated seeding APIs (or 'all') to strip on import instead of running Seeder.py")
+    c.add_argument("--timing", action="store_true",
+                   help="Record per-phase durations and peak RSS of every trial (data/timing.jsonl, "
+                        "summarized by phase_timing.py report)")
+    c.add_argument("--cores", default=None, type=int, required=False,
+                   help="CPU budget: pin every trial to its own CPUs out of the first N this job may use "
+                        "(0: all of them); --workers is then derived from --threads")
+    c.add_argument("--threads", default="1", type=thread_count, required=False,
+                   help="Intra-op threads (and CPUs) per trial with --cores, or 'auto' to tune them per assertion "
+                        "from measured throughput")
     
     args = p.parse_args()
 
@@ -97,18 +206,31 @@ if __name__ == "__main__":
     if args.cmd == "sample_csv":
         t1 = time.time() / 60.0
         seed_configs = [s.strip() for s in args.seed_config_names.split(';') if s.strip()]
+        preload = [s.strip() for s in args.preload.split(',') if s.strip()]
+        adaptive = None
+        if args.adaptive:
+            adaptive = {"precision": args.precision, "threshold": args.threshold,
+                        "confidence": args.confidence, "min_trials": args.min_trials}
         tests = read_csv(args.csv_in, keep_default_na=False)
         if args.assertions:
             ASSERTIONS = set(s.strip() for s in args.assertions.split(",") if s.strip())
             test_tups = [(idx, tup) for idx, tup in enumerate(tests.itertuples()) if assertion_id(tup) in ASSERTIONS]
         else:
             test_tups = list(enumerate(tests.itertuples()))
+        groups = []
         for t in test_tups:
             if not "test" in t[1].testname:
                 continue
-            print(f"\n|{t[0]}:{round((time.time() / 60.0) - t1, 2)}|__________Trying {t[1]}____________________")
-            try:
-                test_line(t[1], args.dir_out, args.repo_name, args.seed_value, args.seed_config_file_in, seed_configs, 
-                          int(args.trials), int(args.workers))
-            except Exception as e:
-                print(f"Skipping {t[0]}", str(e))
\ No newline at end of file
+            print(f"|{t[0]}| Queueing {t[1]}")
+            groups += line_groups(t[1], args.dir_out, args.repo_name, args.seed_value, args.seed_config_file_in, seed_configs,
+                                  int(args.trials), args.backend, args.timeout, adaptive, args.strip_seeds,
+                                  args.timing)
+        Path(args.dir_out).mkdir(parents=True, exist_ok=True)
+        run_groups(groups, do_trial, args.backend, int(args.workers) or os.cpu_count(), args.repo_name, preload,
+                   durations_path=args.durations or str(Path(args.dir_out) / "durations.json"), resume=args.resume,
+                   cache=ResultCache(args.cache_dir, args.cache_max_mb) if args.cache_dir else None,
+                   cpus=cpu_budget(args.cores) if args.cores is not None else None, threads=args.threads)
+        spent = sum(group.completed - group.resumed for group in groups)
+        skipped = sum(group.error is not None for group in groups)
+        print(f"\nDone in {round((time.time() / 60.0) - t1, 2)} min, {skipped} of {len(groups)} groups skipped")
+        print(f"Trials spent: {spent} of {int(args.trials) * len(groups)} budgeted")
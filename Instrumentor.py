@@ -3,16 +3,22 @@ import copy
 from typing import cast
 from pathlib import Path
 import argparse
-from pandas import read_csv
-import pickle
+from ast_store import open_store, open_funcs, open_locations
+from AssertSpecFinder import function_locations
+
+def record_metric(left, right, assertion):
+    # __import__("metric_channel").record(left, right, assertion)
+    channel = ast.Call(ast.Name("__import__", ast.Load()), [ast.Constant("metric_channel")], [])
+    return ast.Expr(ast.Call(ast.Attribute(channel, "record", ast.Load()),
+                             [copy.deepcopy(left), copy.deepcopy(right), ast.Constant(assertion)], []))
 
 class Logger(ast.NodeTransformer):
-    def __init__(self, target_lineno: int):
+    def __init__(self, target_lines):
         super().__init__()
-        self.target_lineno = target_lineno
+        self.target_lines = {target_lines} if isinstance(target_lines, int) else set(target_lines)
 
     def visit_Assert(self, node: ast.Assert):
-        if node.lineno != self.target_lineno:
+        if node.lineno not in self.target_lines:
             return node
         node = cast(ast.Assert, self.generic_visit(node))
 
@@ -26,56 +32,14 @@ class Logger(ast.NodeTransformer):
             )
 
             if is_approx and rhs_call.args:
-                lhs_copy = copy.deepcopy(lhs)
-                fstr_left = ast.JoinedStr([
-                    ast.Constant("\nFLAKY_METRIC: "),
-                    ast.FormattedValue(
-                        value=ast.Call(ast.Name("float", ast.Load()),
-                                    [lhs_copy], []),
-                        conversion=-1, format_spec=None)
-                ])
-                print_left = ast.Expr(
-                    ast.Call(ast.Name("print", ast.Load()), [fstr_left], []))
-
-                ref_copy = copy.deepcopy(rhs_call.args[0])
-                fstr_ref = ast.JoinedStr([
-                    ast.Constant("\nFLAKY_METRIC: "),
-                    ast.FormattedValue(
-                        value=ast.Call(ast.Name("float", ast.Load()),
-                                    [ref_copy], []),
-                        conversion=-1, format_spec=None)
-                ])
-                print_ref = ast.Expr(
-                    ast.Call(ast.Name("print", ast.Load()), [fstr_ref], []))
-
-                return [print_left, print_ref, node]
+                return [record_metric(lhs, rhs_call.args[0], node.lineno), node]
         if isinstance(node.test, ast.Compare):
-            left = copy.deepcopy(node.test.left)
-            right = copy.deepcopy(node.test.comparators[0])
-            fstr_left = ast.JoinedStr([ast.Constant("\nFLAKY_METRIC: "), ast.FormattedValue(value=ast.Call(
-                        func=ast.Name(id="float", ctx=ast.Load()),
-                        args=[ left ],
-                        keywords=[]), 
-                        conversion=-1, format_spec=None)])
-            print_left = ast.Expr(ast.Call(
-                func=ast.Name(id="print", ctx=ast.Load()),
-                args=[fstr_left],
-                keywords=[]))
-            fstr_right = ast.JoinedStr([ast.Constant("\nFLAKY_METRIC: "), ast.FormattedValue(value=ast.Call(
-                        func=ast.Name(id="float", ctx=ast.Load()),
-                        args=[ right ],
-                        keywords=[]),
-                    conversion=-1, format_spec=None)])
-            print_right = ast.Expr(ast.Call(
-                func=ast.Name(id="print", ctx=ast.Load()),
-                args=[fstr_right],
-                keywords=[]))
-            return [print_left, print_right, node]
+            return [record_metric(node.test.left, node.test.comparators[0], node.lineno), node]
         else:
             return node
     
     def visit_Expr(self, node: ast.Expr):
-        if node.lineno != self.target_lineno:
+        if node.lineno not in self.target_lines:
             return self.generic_visit(node)
 
         node = cast(ast.Expr, self.generic_visit(node))
@@ -99,49 +63,44 @@ class Logger(ast.NodeTransformer):
                     elif kw.arg in {"second", "desired", "y", "b"}:  
                         right = kw.value  
             if left and right:
-                left_copy = copy.deepcopy(left)
-                right_copy = copy.deepcopy(right)
-                fstr_left = ast.JoinedStr([ast.Constant("\nFLAKY_METRIC: "), ast.FormattedValue(value=ast.Call(
-                            func=ast.Name(id="float", ctx=ast.Load()),
-                            args=[ left_copy ],
-                            keywords=[]), 
-                            conversion=-1, format_spec=None)])
-                print_left = ast.Expr(ast.Call(
-                    func=ast.Name(id="print", ctx=ast.Load()),
-                    args=[fstr_left],
-                    keywords=[]))
-                fstr_right = ast.JoinedStr([ast.Constant("\nFLAKY_METRIC: "), ast.FormattedValue(value=ast.Call(
-                            func=ast.Name(id="float", ctx=ast.Load()),
-                            args=[ right_copy ],
-                            keywords=[]),
-                        conversion=-1, format_spec=None)])
-                print_right = ast.Expr(ast.Call(
-                    func=ast.Name(id="print", ctx=ast.Load()),
-                    args=[fstr_right],
-                    keywords=[]))
-                return [print_left, print_right, node]
+                return [record_metric(left, right, node.lineno), node]
         return node
     
-def log_assertion(PATH, CLS, TST, AST_DICT, FUNCS_DICT, LINE_NO):
+def follow(tree, steps):
+    # the statement list a node path ends in and the index there, or None if the path is stale
+    node = tree
+    try:
+        for field, i in steps[:-1]:
+            node = getattr(node, field)[i]
+        field, i = steps[-1]
+        body = getattr(node, field)
+        return body, i, body[i]
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+def find_function(tree, CLS, TST, location=None):
+    # location comes from the index the miner saved; it is rebuilt when missing or out of date
+    def is_test(found):
+        return found and isinstance(found[2], (ast.FunctionDef, ast.AsyncFunctionDef)) and found[2].name == TST
+    key = CLS + "." + TST
+    found = follow(tree, location) if location else None
+    if not is_test(found):
+        steps = function_locations(tree).get(key)
+        found = follow(tree, steps) if steps else None
+    if not is_test(found):
+        raise KeyError("Test function not found", key)
+    return found[0], found[1]
+
+def replace_function(tree, CLS, TST, func_node, location=None):
+    body, i = find_function(tree, CLS, TST, location)
+    body[i] = func_node
+
+def log_assertion(PATH, CLS, TST, AST_DICT, FUNCS_DICT, LINE_NO, LOCATIONS=None):
     logged_tree = copy.deepcopy(AST_DICT[PATH])
     func_node = copy.deepcopy(FUNCS_DICT[PATH][CLS + "." + TST])
     logger = Logger(LINE_NO)
     logged_func_node = logger.visit(func_node)
-
-    if CLS:
-        for cls_node in logged_tree.body:
-            if isinstance(cls_node, ast.ClassDef) and cls_node.name == CLS:
-                for i, member in enumerate(cls_node.body):
-                    if (isinstance(member, ast.FunctionDef) and member.name == TST and cls_node.name == CLS):
-                        cls_node.body[i] = logged_func_node
-                        break
-                break
-
-    else:
-        for i, member in enumerate(logged_tree.body):
-            if isinstance(member, ast.FunctionDef) and member.name == TST:
-                logged_tree.body[i] = logged_func_node
-                break
+    replace_function(logged_tree, CLS, TST, logged_func_node, (LOCATIONS or {}).get(PATH, {}).get(CLS + "." + TST))
             
     ast.fix_missing_locations(logged_tree)
     logged_code = ast.unparse(logged_tree)
@@ -149,25 +108,74 @@ def log_assertion(PATH, CLS, TST, AST_DICT, FUNCS_DICT, LINE_NO):
     Path(orig.with_name(f"{orig.stem}_{LINE_NO}{orig.suffix}")).write_text(logged_code)
     return logged_tree, logged_func_node
 
+def batch_path(PATH):
+    orig = Path(PATH)
+    return str(orig.with_name(f"{orig.stem}_logged{orig.suffix}"))
+
+def log_file(PATH, TESTS, AST_DICT, FUNCS_DICT, LOCATIONS=None):
+    # TESTS: (CLS, TST, LINE_NO) of every assertion to instrument in PATH; one copy, one module
+    logged_tree = copy.deepcopy(AST_DICT[PATH])
+    lines = {}
+    for CLS, TST, LINE_NO in TESTS:
+        lines.setdefault((CLS, TST), set()).add(LINE_NO)
+    for (CLS, TST), LINES in lines.items():
+        func_node = copy.deepcopy(FUNCS_DICT[PATH][CLS + "." + TST])
+        replace_function(logged_tree, CLS, TST, Logger(LINES).visit(func_node),
+                         (LOCATIONS or {}).get(PATH, {}).get(CLS + "." + TST))
+
+    ast.fix_missing_locations(logged_tree)
+    out_path = batch_path(PATH)
+    Path(out_path).write_text(ast.unparse(logged_tree))
+    return out_path
+
 if __name__ == "__main__":
+    # imported lazily so pytest workers can load the Logger without pandas
+    from pandas import read_csv
+
     p = argparse.ArgumentParser(description="Instrumentor CLI")
     sub = p.add_subparsers(dest="cmd", required=True)
 
-    c = sub.add_parser("log", help="Add print statements to assertions")
+    c = sub.add_parser("log", help="Add metric recording to assertions")
     c.add_argument("--csv-in", required=True)
     c.add_argument("--csv-out", required=True)
     c.add_argument("--asts-in", required=True)
     c.add_argument("--funcs-in", required=True)
+    c.add_argument("--reparse", action="store_true",
+                   help="Parse the source files instead of loading the stored ASTs")
+    c.add_argument("--batch", action="store_true",
+                   help="Instrument all selected assertions of a file into one <stem>_logged.py")
 
     args = p.parse_args()
 
     tests = read_csv(args.csv_in, keep_default_na=False)
     tests['logged_path'] = ''
 
-    with open(args.asts_in, "rb") as f: asts = pickle.load(f)
-    with open(args.funcs_in, "rb") as f: funcs = pickle.load(f)
+    asts = open_store(args.asts_in, reparse=args.reparse)
+    funcs = open_funcs(args.funcs_in)
+    locations = open_locations(args.funcs_in)
+
+    if args.cmd == "log" and args.batch:
+        per_file = {}
+        for idx, test in enumerate(tests.itertuples()):
+            per_file.setdefault(str(test.filepath), []).append(
+                (idx, str(test.testclass), str(test.testname), int(str(test.line_number))))
+        for path, rows in per_file.items():
+            print(f"Processing {len(rows)} assertions in {path}")
+            try:
+                out_path = log_file(PATH=path,
+                                    TESTS=[row[1:] for row in rows],
+                                    AST_DICT=asts,
+                                    FUNCS_DICT=funcs,
+                                    LOCATIONS=locations)
+                for idx, *_ in rows:
+                    tests.loc[idx, 'logged_path'] = out_path
+                print(f"Logged version → {out_path}")
+            except Exception as e:
+                print(f"Error with: {e}")
+
+        tests.to_csv(args.csv_out, index=False)
 
-    if args.cmd == "log":
+    elif args.cmd == "log":
         for idx, test in enumerate(tests.itertuples()):
             print(f"{idx}: Processing {test}")
             try:
@@ -176,7 +184,8 @@ if __name__ == "__main__":
                             TST=str(test.testname),
                             AST_DICT=asts,
                             FUNCS_DICT=funcs,
-                            LINE_NO=int(str(test.line_number)) )
+                            LINE_NO=int(str(test.line_number)),
+                            LOCATIONS=locations)
                 out_path = str(test.filepath)[:-3] + "_" + str(test.line_number) + ".py"
                 tests.loc[idx, 'logged_path'] = out_path
                 print(f"Logged version → {out_path}")
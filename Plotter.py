@@ -0,0 +1,100 @@
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from matplotlib.figure import Figure
+
+from result_store import INDEX, ResultStore, from_bytes
+
+# Renders the per-parametrization histograms from stored results, as a stage
+# of its own rather than inside the sampler. Figures are built with the
+# object API (no pyplot, so nothing is kept alive between plots) and written
+# by the headless Agg canvas, one (test, seed config) group per task on a
+# process pool. A plot is only rendered when it is missing or older than the
+# data it shows, so re-running after more sampling or a merge is cheap.
+
+def plot_distribution(data, bins=20, title='Distribution', xlabel='Value', ylabel='Frequency', expected=None):
+    fig = Figure()
+    ax = fig.subplots()
+    ax.hist(data, bins=bins, edgecolor='black', alpha=0.75)
+    if expected is not None:
+        ax.axvline(expected, color='red', linestyle='--', linewidth=2, label=f'Expected = {expected}', zorder=5)
+        ax.legend()
+    ax.set_title(title)
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+    return fig, ax
+
+def stale(png, source_mtime):
+    try:
+        return os.stat(png).st_mtime_ns < source_mtime
+    except FileNotFoundError:
+        return True
+
+def store_tasks(root, force=False):
+    # {values file: [(offset, n, expected, title, png)]} for the plots that need rendering
+    tasks = {}
+    for row in ResultStore(root):
+        source = root / row["file"]
+        png = root / row["test_name"] / row["seed_cfg"] / "plot" / f"_{row['expected']}_{row['param']}.png"
+        if row["n"] and (force or stale(png, os.stat(source).st_mtime_ns)):
+            tasks.setdefault(source, []).append((row["offset"], row["n"], row["expected"], str(row["param"]), png))
+    return tasks
+
+def text_tasks(root, force=False):
+    # legacy layout: <test>/<seed>/data/_<expected>_<param>.txt, one file per task
+    tasks = {}
+    for txt_path in root.glob("*/*/data/_*_*.txt"):
+        expected, param = txt_path.stem[1:].rsplit("_", 1)
+        png = txt_path.parent.parent / "plot" / f"{txt_path.stem}.png"
+        if force or stale(png, os.stat(txt_path).st_mtime_ns):
+            tasks[txt_path] = [(None, None, float(expected), param, png)]
+    return tasks
+
+def render_source(source, items, bins=20):
+    if items[0][0] is None:
+        with open(source) as f:
+            series = [[float(line) for line in f if line.strip()]]
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+        series = [from_bytes(data[offset * 8:(offset + n) * 8]) for offset, n, _, _, _ in items]
+    for values, (_, _, expected, title, png) in zip(series, items):
+        if not values:
+            continue
+        png.parent.mkdir(parents=True, exist_ok=True)
+        fig, _ = plot_distribution(values, bins=bins, title=title, expected=expected)
+        tmp = png.with_name(png.stem + ".tmp.png")
+        fig.savefig(tmp)
+        os.replace(tmp, png)
+    return len(items)
+
+def render(root, jobs=None, force=False, bins=20):
+    root = Path(root).expanduser().resolve()
+    tasks = store_tasks(root, force) if (root / INDEX).exists() else text_tasks(root, force)
+    if not tasks:
+        print(f"All plots under {root} are up to date")
+        return 0
+    rendered = 0
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(render_source, source, items, bins) for source, items in tasks.items()]
+        for future in futures:
+            rendered += future.result()
+    print(f"Rendered {rendered} plots under {root}")
+    return rendered
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Plotter CLI")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("render", help="Render the missing or outdated distribution plots of a results dir")
+    r.add_argument("--root", required=True)
+    r.add_argument("--jobs", default=None, type=int, required=False)
+    r.add_argument("--bins", default=20, type=int, required=False)
+    r.add_argument("--force", action="store_true", help="Re-render every plot")
+
+    args = p.parse_args()
+
+    if args.cmd == "render":
+        render(args.root, args.jobs, args.force, args.bins)
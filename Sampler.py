@@ -1,44 +1,454 @@
+import contextlib
+import importlib
+import io
+import itertools
+import multiprocessing
 import os
+import random
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing.connection import wait
 from pathlib import Path
 
-def run_pytest(LOGGED_PATH, CLASS, TEST, repo_name, seed_value, seed_config_name, seed_config_file):
+import metric_channel
+import phase_timing
+
+BACKENDS = ("subprocess", "warm", "fork")
+# instrumented tests import metric_channel from here, so every backend puts it on the path
+CHANNEL_DIR = str(Path(__file__).resolve().parent)
+# intra-op thread pools sized to a trial's CPU set
+THREAD_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS",
+               "VECLIB_MAXIMUM_THREADS")
+
+def resolve_test(LOGGED_PATH, repo_name):
     cwd = Path.cwd()
     project_root = cwd / repo_name
     test_path = Path(LOGGED_PATH)
     if not test_path.is_absolute():
         test_path = cwd / test_path
     test_path = test_path.resolve()
-    rel = test_path.relative_to(project_root)
+    return project_root, test_path.relative_to(project_root.resolve())
 
-    nodeid = f"{rel}::{CLASS}::{TEST}" if CLASS else f"{rel}::{TEST}"
+def build_nodeid(LOGGED_PATH, CLASS, TEST, repo_name):
+    project_root, rel = resolve_test(LOGGED_PATH, repo_name)
+    # nested classes are mined as "Outer.Inner"
+    nodeid = f"{rel}::{CLASS.replace('.', '::')}::{TEST}" if CLASS else f"{rel}::{TEST}"
+    return project_root, rel, nodeid
 
+def pytest_args(nodeid, seed_value, seed_config_name, seed_config_file, param_indices=None, repeat=1):
     args = [
-        sys.executable, "-m", "pytest",
         str(nodeid),
-        "-q", "-s",
+        "-q", "-p", "metric_channel",
         "--seed-config-file", seed_config_file,
         "--seed-config-name", seed_config_name,
         "--seed-value",       str(seed_value),
     ]
+    if param_indices is not None:
+        args += ["--metric-indices", ",".join(str(i) for i in param_indices)]
+    if repeat > 1:
+        args += ["--flaky-repeat", str(repeat)]
+    return args
+
+def hook_args(path, instrument_lines=None, strip_seeds=None):
+    # instrument_hook transforms the original file on import, so nothing is written into the repo;
+    # path is absolute, as pytest's rootdir need not be the project root
+    if not instrument_lines and not strip_seeds:
+        return []
+    args = ["-p", "instrument_hook", "-p", "no:cacheprovider"]
+    if instrument_lines:
+        args += ["--instrument", f"{path}:{','.join(str(l) for l in sorted(instrument_lines))}"]
+    if strip_seeds:
+        args += ["--strip-seeds", ",".join(sorted(strip_seeds))]
+    return args
+
+def thread_env(cpus):
+    return {var: str(len(cpus)) for var in THREAD_VARS}
+
+def pin(pid, cpus):
+    # pid 0 is the calling process; threads it starts afterwards inherit the CPU set
+    try:
+        os.sched_setaffinity(pid, cpus)
+    except (AttributeError, OSError) as e:
+        print(f"Could not pin {pid or os.getpid()} to CPUs {sorted(cpus)}: {e}", file=sys.stderr)
+
+def set_threads(n):
+    # thread pools of libraries imported before the trial (warm and forked workers) ignore THREAD_VARS
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return None
+    previous = torch.get_num_threads()
+    torch.set_num_threads(n)
+    return previous
+
+_timing = threading.local()
+
+def take_timing():
+    # phase timing of the last run_pytest(timing=True) on this thread, handed to the scheduler once
+    timing, _timing.last = getattr(_timing, "last", None), None
+    return timing
+
+def run_pytest(LOGGED_PATH, CLASS, TEST, repo_name, seed_value, seed_config_name, seed_config_file, backend="subprocess",
+               timeout=180, param_indices=None, instrument_lines=None, strip_seeds=None, timing=False, repeat=1,
+               cpus=None):
+    # repeat > 1 runs the test that many times in one session (metric records are tagged per repetition);
+    # cpus pins the trial to those CPUs, with one intra-op thread per CPU
+    project_root, rel, nodeid = build_nodeid(LOGGED_PATH, CLASS, TEST, repo_name)
+    hook = hook_args(project_root.resolve() / rel, instrument_lines, strip_seeds)
+    args = pytest_args(nodeid, seed_value, seed_config_name, seed_config_file, param_indices, repeat) + hook
+
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+    channel = metric_channel.new_channel()
+    env = {metric_channel.ENV_VAR: channel}
+    if cpus:
+        env.update(thread_env(cpus))
+    if timing:
+        timing_file = phase_timing.new_file()
+        env[phase_timing.ENV_VAR] = timing_file
+        args += ["-p", "phase_timing"]
+    launched = time.time()
     try:
-        proc = subprocess.run(
-            args,
-            cwd=str(project_root),
-            capture_output=True,
-            text=True,
-            timeout=180,
-        )
-    except subprocess.TimeoutExpired as e:
+        if backend == "warm":
+            pkg = run_warm(project_root, rel, args, timeout=timeout, env=env, cpus=cpus)
+        elif backend == "fork":
+            pkg = zygote_for(project_root, rel, hook).run(args, timeout=timeout, env=env, cpus=cpus)
+        else:
+            pkg = run_subprocess(project_root, args, timeout=timeout, env=env, cpus=cpus)
+    finally:
+        metrics = metric_channel.read_records(channel)
+        if timing:
+            _timing.last = phase_timing.collect(timing_file, launched, time.time())
+    pkg["metrics"] = metrics
+    return pkg
+
+def _lines(stream):
+    if not stream:
+        return []
+    if isinstance(stream, bytes):
+        stream = stream.decode(errors="replace")
+    return stream.splitlines()
+
+def run_subprocess(project_root, args, timeout=180, env=None, cpus=None):
+    child_env = dict(os.environ)
+    child_env["PYTHONPATH"] = os.pathsep.join(p for p in (child_env.get("PYTHONPATH"), CHANNEL_DIR) if p)
+    child_env.update(env or {})
+    # own session so a timeout also takes down anything the test spawned (dataloader workers etc.)
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "pytest", *args],
+        cwd=str(project_root),
+        env=child_env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        start_new_session=True,
+    )
+    if cpus:
+        # the interpreter is still starting up, before torch & co. start their threads
+        pin(proc.pid, cpus)
+    try:
+        stdout, stderr = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        with contextlib.suppress(ProcessLookupError):
+            os.killpg(proc.pid, signal.SIGKILL)
+        stdout, stderr = proc.communicate()
         return {
             "returncode": 124,
-            "stdout": e.stdout.splitlines() or [],
-            "stderr": (e.stderr or [f"pytest timed out after {e.timeout}s"]).splitlines(),
+            "stdout": _lines(stdout),
+            "stderr": _lines(stderr) + [f"pytest timed out after {timeout}s"],
         }
 
     return {
         "returncode": proc.returncode,
-        "stdout":     proc.stdout.splitlines(),
-        "stderr":     proc.stderr.splitlines(),
-    }
\ No newline at end of file
+        "stdout":     _lines(stdout),
+        "stderr":     _lines(stderr),
+    }
+
+def trial_executor(backend, max_workers, repo_name, preload=()):
+    if backend == "warm":
+        return ProcessPoolExecutor(max_workers=max_workers, initializer=warm_init,
+                                   initargs=(repo_name, tuple(preload)))
+    if backend == "fork":
+        return ZygotePool(max_workers=max_workers, preload=preload)
+    # pytest children are driven straight from threads of this process, no intermediate pool process
+    return ThreadPoolExecutor(max_workers=max_workers)
+
+# ---------------------------------------------------------------------------
+# Warm workers: long-lived processes (e.g. ProcessPoolExecutor workers) that
+# import the heavy dependencies once and then run pytest in-process per trial.
+# ---------------------------------------------------------------------------
+
+_timed_out = False
+
+def warm_init(repo_name, preload=()):
+    project_root = str((Path.cwd() / repo_name).resolve())
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    if CHANNEL_DIR not in sys.path:
+        sys.path.append(CHANNEL_DIR)
+    import pytest  # noqa: F401
+    for module in preload:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            print(f"Warm worker could not preload {module!r}: {e}", file=sys.stderr)
+
+def reseed_from_entropy():
+    random.seed()
+    np = sys.modules.get("numpy")
+    if np is not None:
+        np.random.seed()
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.seed()
+
+def forget_test_modules(test_root, before):
+    test_root = str(test_root)
+    for name in set(sys.modules) - before:
+        path = getattr(sys.modules[name], "__file__", None) or ""
+        if path.startswith(test_root) or name == "conftest" or name.endswith(".conftest"):
+            del sys.modules[name]
+
+def _raise_timeout(signum, frame):
+    # pytest turns KeyboardInterrupt into an interrupted session instead of a test failure
+    global _timed_out
+    _timed_out = True
+    raise KeyboardInterrupt("trial timed out")
+
+def run_warm(project_root, rel, args, timeout=180, env=None, cpus=None):
+    global _timed_out
+    import pytest
+
+    project_root = Path(project_root).resolve()
+    test_root = project_root / rel.parts[0] if len(rel.parts) > 1 else project_root / rel
+    before = set(sys.modules)
+    out, err = io.StringIO(), io.StringIO()
+    prev_cwd = os.getcwd()
+    prev_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    returncode = 124
+    _timed_out = False
+    prev_env = {key: os.environ.get(key) for key in env or {}}
+    os.environ.update(env or {})
+    metric_channel.reset()
+    reseed_from_entropy()
+    prev_cpus = os.sched_getaffinity(0) if cpus else None
+    prev_threads = None
+    if cpus:
+        pin(0, cpus)
+        prev_threads = set_threads(len(cpus))
+    try:
+        os.chdir(project_root)
+        signal.alarm(timeout)
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            returncode = int(pytest.main(list(args)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, prev_handler)
+        os.chdir(prev_cwd)
+        if cpus:
+            pin(0, prev_cpus)
+            if prev_threads is not None:
+                set_threads(prev_threads)
+        metric_channel.reset()
+        for key, value in prev_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        forget_test_modules(test_root, before)
+    if _timed_out:
+        returncode = 124
+        err.write(f"pytest timed out after {timeout}s\n")
+
+    return {
+        "returncode": returncode,
+        "stdout":     out.getvalue().splitlines(),
+        "stderr":     err.getvalue().splitlines(),
+    }
+
+# ---------------------------------------------------------------------------
+# Zygote: a parent process that imports the test module once and fork()s a
+# child per trial, so every trial starts from the same copy-on-write snapshot.
+# ---------------------------------------------------------------------------
+
+_zygotes = {}
+_zygotes_lock = threading.Lock()
+_zygote_preload = ()
+
+def _zygote_child(args, env, out_path, err_path, cpus=None):
+    import pytest
+
+    returncode = 3
+    try:
+        for fd, path in ((1, out_path), (2, err_path)):
+            target = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            os.dup2(target, fd)
+            os.close(target)
+        os.environ.update(env)
+        if cpus:
+            pin(0, cpus)
+            set_threads(len(cpus))
+        metric_channel.reset()
+        reseed_from_entropy()
+        returncode = int(pytest.main(list(args)))
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(returncode)
+
+def _zygote_main(conn, project_root, rel, preload, warm_args=()):
+    os.chdir(project_root)
+    if project_root not in sys.path:
+        sys.path.insert(0, project_root)
+    warm_init(project_root, preload)
+    import pytest
+
+    # collect the target file once so the test module, its conftests and their imports are all loaded
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pytest.main([rel, "--collect-only", "-q", "-p", "no:cacheprovider", *warm_args])
+
+    scratch = tempfile.mkdtemp(prefix="zygote_")
+    children = {}   # read fd -> (trial id, pid, timeout, deadline, stdout path, stderr path)
+    running = True
+    while running or children:
+        now = time.monotonic()
+        timeout = min((c[3] for c in children.values()), default=now + 1.0) - now
+        ready = wait(([conn] if running else []) + list(children), timeout=max(timeout, 0))
+
+        if conn in ready:
+            try:
+                msg = conn.recv()
+            except EOFError:
+                msg = None
+            if msg is None:
+                running = False
+            else:
+                trial_id, args, env, trial_timeout, cpus = msg
+                out_path = os.path.join(scratch, f"{trial_id}.out")
+                err_path = os.path.join(scratch, f"{trial_id}.err")
+                r, w = os.pipe()
+                pid = os.fork()
+                if pid == 0:
+                    os.close(r)
+                    _zygote_child(args, env, out_path, err_path, cpus)
+                os.close(w)
+                children[r] = (trial_id, pid, trial_timeout, time.monotonic() + trial_timeout, out_path, err_path)
+
+        now = time.monotonic()
+        for r, (trial_id, pid, trial_timeout, deadline, out_path, err_path) in list(children.items()):
+            timed_out = r not in ready and now >= deadline
+            if r not in ready and not timed_out:
+                continue
+            if timed_out:
+                os.kill(pid, signal.SIGKILL)
+            _, status = os.waitpid(pid, 0)
+            os.close(r)
+            del children[r]
+            returncode = 124 if timed_out else os.waitstatus_to_exitcode(status)
+            streams = []
+            for path in (out_path, err_path):
+                try:
+                    with open(path, errors="replace") as f:
+                        streams.append(f.read().splitlines())
+                    os.unlink(path)
+                except FileNotFoundError:
+                    streams.append([])
+            if timed_out:
+                streams[1].append(f"pytest timed out after {trial_timeout}s")
+            try:
+                conn.send((trial_id, returncode, streams[0], streams[1]))
+            except (BrokenPipeError, OSError):
+                running = False
+    os.rmdir(scratch)
+
+class Zygote:
+    def __init__(self, project_root, rel, preload=(), warm_args=()):
+        ctx = multiprocessing.get_context("spawn")
+        self._conn, child_conn = ctx.Pipe()
+        self._proc = ctx.Process(target=_zygote_main, daemon=True,
+                                 args=(child_conn, str(Path(project_root).resolve()), str(rel), tuple(preload),
+                                       tuple(warm_args)))
+        self._proc.start()
+        child_conn.close()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count()
+        self._reader = threading.Thread(target=self._read_results, daemon=True)
+        self._reader.start()
+
+    def run(self, args, timeout=180, env=None, cpus=None):
+        future = Future()
+        with self._lock:
+            trial_id = next(self._ids)
+            self._pending[trial_id] = future
+            self._conn.send((trial_id, list(args), dict(env or {}), timeout, cpus))
+        return future.result()
+
+    def _read_results(self):
+        while True:
+            try:
+                trial_id, returncode, stdout, stderr = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(trial_id)
+            future.set_result({"returncode": returncode, "stdout": stdout, "stderr": stderr})
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError("Zygote process exited", self._proc.exitcode))
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        self._reader.join()
+        self._proc.join()
+        self._conn.close()
+
+def zygote_for(project_root, rel, warm_args=()):
+    # the import hook options change what the snapshot imported, so they are part of the key
+    key = (str(Path(project_root).resolve()), str(rel), tuple(warm_args))
+    with _zygotes_lock:
+        if key not in _zygotes:
+            _zygotes[key] = Zygote(project_root, rel, _zygote_preload, warm_args)
+        return _zygotes[key]
+
+def release(LOGGED_PATH, repo_name):
+    # called once no more trials of this test file are coming, so its zygote (if any) can go
+    project_root, rel = resolve_test(LOGGED_PATH, repo_name)
+    prefix = (str(Path(project_root).resolve()), str(rel))
+    with _zygotes_lock:
+        zygotes = [_zygotes.pop(key) for key in list(_zygotes) if key[:2] == prefix]
+    for zygote in zygotes:
+        zygote.close()
+
+def close_zygotes():
+    with _zygotes_lock:
+        zygotes = list(_zygotes.values())
+        _zygotes.clear()
+    for zygote in zygotes:
+        zygote.close()
+
+class ZygotePool(ThreadPoolExecutor):
+    # threads only block on zygote replies; the trials themselves run in forked children
+    def __init__(self, max_workers=None, preload=()):
+        global _zygote_preload
+        super().__init__(max_workers=max_workers)
+        _zygote_preload = tuple(preload)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        super().shutdown(wait=wait, cancel_futures=cancel_futures)
+        close_zygotes()
@@ -0,0 +1,368 @@
+import json
+import math
+import os
+import statistics
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+
+import phase_timing
+from Sampler import trial_executor, release, take_timing
+
+# One long-lived executor and one queue for every (assertion, seed config)
+# group of a campaign. Groups are served longest-expected-trial first, using
+# per-trial durations remembered from earlier runs, and the free slots of a
+# group that is waiting (adaptive stop checks, last stragglers) go to the next
+# group, so the pool never drains at a test boundary.
+#
+# A group with a log path appends every completed trial to it as one JSON
+# line (flushed and fsynced), so a preempted job loses at most the trials in
+# flight; `resume()` replays the log and only the remainder is sampled.
+# Trials run with phase timing also append their timings to timing.jsonl
+# next to the log, summarized per group when it finishes.
+#
+# An input with "repeat": K stands for K trials run in one invocation; the
+# trial function then returns a list of up to K results, each completed and
+# logged on its own.
+#
+# Given a CPU budget, every trial in flight holds a disjoint set of those
+# CPUs ("cpus" in its input, one intra-op thread each) and trials are started
+# while enough of them are free. The thread count is fixed, or tuned per group
+# by trying each candidate on a few probe trials and keeping the one with the
+# most trials per CPU-second; the measurements are remembered in threads.json.
+# Probe trials are only timed, never kept: a group samples, logs and caches
+# trials of a single thread count, recorded with each logged trial.
+
+class TrialGroup(ABC):
+    def __init__(self, key, test_input, trials, path, log_path=None):
+        self.key = key
+        self.test_input = test_input
+        self.trials = trials
+        self.path = path
+        self.log_path = log_path
+        self.timing_path = str(Path(log_path).with_name("timing.jsonl")) if log_path else None
+        self.submitted = 0
+        self.completed = 0
+        self.resumed = 0
+        self.in_flight = 0
+        self.seconds = 0.0
+        self.error = None
+        # intra-op threads per trial when pinned, decided by run_groups before any trial is kept
+        self.threads = None
+
+    def stopped(self):
+        return False
+
+    def wants_more(self):
+        return self.error is None and self.submitted < self.trials and not self.stopped()
+
+    def next_input(self):
+        return dict(self.test_input)
+
+    @abstractmethod
+    def add(self, result):
+        pass
+
+    @abstractmethod
+    def finish(self):
+        pass
+
+    def encode(self, result):
+        return result
+
+    def decode(self, entry):
+        return entry
+
+    def complete(self, result, seconds=0.0):
+        self.completed += 1
+        self.seconds += seconds
+        self.add(result)
+
+    def resume(self):
+        # replay logged trials; a line cut short by the preemption is dropped. Trials run with another
+        # thread count than this group's are skipped but stay in the log; untagged trials, logged
+        # before the count was recorded, ran with one thread
+        if self.log_path is None or not os.path.exists(self.log_path):
+            return 0
+        with open(self.log_path, "rb") as f:
+            data = f.read()
+        keep = data.rfind(b"\n") + 1
+        skipped = 0
+        for line in data[:keep].splitlines():
+            if self.completed >= self.trials:
+                break
+            entry = json.loads(line)
+            threads, entry = (entry["threads"], entry["trial"]) if isinstance(entry, dict) else (None, entry)
+            if (threads or 1) != (self.threads or 1):
+                skipped += 1
+                continue
+            self.complete(self.decode(entry))
+        if skipped:
+            print(f"Skipped {skipped} logged trials of {self.key} run with other thread counts")
+        if keep < len(data):
+            os.truncate(self.log_path, keep)
+        self.submitted = self.resumed = self.completed
+        return self.resumed
+
+    def log(self, result):
+        if self.log_path is None:
+            return
+        entry = self.encode(result)
+        if self.threads is not None:
+            entry = {"threads": self.threads, "trial": entry}
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def log_timing(self, timing):
+        if self.timing_path is None or timing is None:
+            return
+        with open(self.timing_path, "a") as f:
+            f.write(json.dumps(timing) + "\n")
+
+    def fail(self, error):
+        if self.error is None:
+            self.error = RuntimeError(f"Trial {self.completed + 1} failed", error)
+
+def cpu_budget(cores=None):
+    # the first `cores` CPUs this process may run on (all of them by default, e.g. a Slurm job's cpuset)
+    cpus = sorted(os.sched_getaffinity(0))
+    if cores:
+        if cores > len(cpus):
+            raise RuntimeError("Core budget exceeds the available CPUs", cores, len(cpus))
+        cpus = cpus[:cores]
+    return cpus
+
+def thread_count(value):
+    return value if value == "auto" else int(value)
+
+class CoreBudget:
+    def __init__(self, cpus):
+        self.free = sorted(cpus)
+
+    def take(self, n):
+        cpus, self.free = self.free[:n], self.free[n:]
+        return cpus
+
+    def give(self, cpus):
+        self.free = sorted(self.free + list(cpus))
+
+class ThreadTuner:
+    def __init__(self, candidates, probes=2, history=None):
+        self.candidates = candidates
+        self.probes = probes
+        self.seconds = {t: [] for t in candidates}
+        self.started = {t: 0 for t in candidates}
+        for t, seconds in (history or {}).items():
+            if int(t) in self.seconds:
+                self.seconds[int(t)].append(seconds)
+                self.started[int(t)] = probes
+
+    def cost(self, threads):
+        # CPU-seconds per trial
+        return threads * statistics.median(self.seconds[threads])
+
+    def best(self):
+        measured = [t for t in self.candidates if self.seconds[t]]
+        return min(measured, key=self.cost) if measured else self.candidates[0]
+
+    def next_threads(self):
+        # the next candidate to probe, None once every candidate has been started often enough
+        for t in self.candidates:
+            if self.started[t] < self.probes:
+                return t
+        return None
+
+    def start(self, threads):
+        self.started[threads] = self.started.get(threads, 0) + 1
+
+    def record(self, threads, seconds):
+        self.seconds.setdefault(threads, []).append(seconds)
+
+    def history(self):
+        return {str(t): statistics.median(v) for t, v in self.seconds.items() if v}
+
+def thread_candidates(n_cpus, limit=16):
+    candidates = [1]
+    while candidates[-1] * 2 <= min(n_cpus, limit):
+        candidates.append(candidates[-1] * 2)
+    return candidates
+
+def timed_trial(fn, test_input):
+    start = time.monotonic()
+    take_timing()
+    result = fn(test_input)
+    return result, time.monotonic() - start, take_timing()
+
+def load_durations(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_durations(path, durations):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(durations, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+def open_logs(groups, resume=False, cache=None):
+    resumed, cached = 0, 0
+    for group in groups:
+        if group.log_path is None:
+            continue
+        # a group whose log cannot be opened (e.g. its test path is not in the repo) fails on its own
+        try:
+            Path(group.log_path).parent.mkdir(parents=True, exist_ok=True)
+            if not resume:
+                open(group.log_path, "w").close()
+                if os.path.exists(group.timing_path):
+                    os.unlink(group.timing_path)
+            if cache is not None:
+                cached += cache.restore(group)
+            resumed += group.resume()
+        except Exception as e:
+            group.error = e
+    if resume or cache is not None:
+        print(f"Resumed {resumed} logged trials ({cached} from cache)")
+    return resumed
+
+def run_groups(groups, do_trial, backend, max_workers, repo_name, preload=(), durations_path=None, resume=False,
+               cache=None, cpus=None, threads=1):
+    # cpus: pin every trial to `threads` of these CPUs ("auto": tuned per group); max_workers is then
+    # however many trials the budget fits
+    durations = load_durations(durations_path) if durations_path else {}
+    budget = CoreBudget(cpus) if cpus else None
+    tuners, tuning_path, tuning = {}, None, {}
+    if budget is not None:
+        max_workers = len(cpus)
+        if threads == "auto":
+            tuning_path = str(Path(durations_path).with_name("threads.json")) if durations_path else None
+            tuning = load_durations(tuning_path) if tuning_path else {}
+            tuners = {group: ThreadTuner(thread_candidates(len(cpus)), history=tuning.get(group.key))
+                      for group in groups}
+            for group, tuner in tuners.items():
+                if tuner.next_threads() is None:
+                    group.threads = tuner.best()
+            print(f"Pinning trials to {len(cpus)} CPUs, tuning threads per trial over {thread_candidates(len(cpus))}")
+        elif threads > len(cpus):
+            raise RuntimeError("More threads per trial than CPUs in the budget", threads, len(cpus))
+        else:
+            for group in groups:
+                group.threads = threads
+            print(f"Pinning trials to {len(cpus)} CPUs, {threads} threads each ({len(cpus) // threads} at a time)")
+
+    def probing(group):
+        return group in tuners and group.threads is None
+
+    def threads_for(group):
+        return tuners[group].next_threads() if probing(group) else group.threads
+
+    def wants(group):
+        if probing(group):
+            return group.error is None and tuners[group].next_threads() is not None
+        return group.wants_more()
+
+    def has_room(group):
+        if budget is None:
+            return len(pending) < max_workers
+        return len(budget.free) >= threads_for(group)
+
+    def tuned(group):
+        group.threads = tuners[group].best()
+        tuning[group.key] = tuners[group].history()
+        print(f"\n{group.key}: {group.threads} threads per trial")
+        open_logs([group], resume, cache)
+        if tuning_path:
+            save_durations(tuning_path, tuning)
+
+    # the logs (and cache entries) of groups still tuning are opened once their thread count is known
+    open_logs([group for group in groups if not probing(group)], resume, cache)
+    # groups never timed before go first, so that they get measured
+    order = sorted(groups, key=lambda g: -durations.get(g.key, math.inf))
+    open_per_path = Counter(group.path for group in order)
+    pending = {}
+    finished = 0
+
+    def finalize(group):
+        order.remove(group)
+        try:
+            if group.error is not None:
+                raise group.error
+            group.finish()
+        except Exception as e:
+            group.error = e
+            print(f"\nSkipping {group.key}", str(e))
+        if cache is not None and group.error is None:
+            cache.store(group)
+        if group.timing_path and os.path.exists(group.timing_path):
+            phase_timing.write_summary(group.timing_path)
+        if group.completed > group.resumed:
+            durations[group.key] = group.seconds / (group.completed - group.resumed)
+            if durations_path:
+                save_durations(durations_path, durations)
+        open_per_path[group.path] -= 1
+        if open_per_path[group.path] == 0:
+            try:
+                release(group.path, repo_name)
+            except Exception as e:
+                print(f"\nCould not release {group.path}", str(e))
+
+    with trial_executor(backend, max_workers, repo_name, preload) as executor:
+        while order:
+            for group in order:
+                while wants(group) and has_room(group):
+                    test_input = group.next_input()
+                    probe = probing(group)
+                    if budget is not None:
+                        test_input["cpus"] = budget.take(threads_for(group))
+                    if probe:
+                        tuners[group].start(len(test_input["cpus"]))
+                    else:
+                        group.submitted += test_input.get("repeat") or 1
+                    future = executor.submit(timed_trial, do_trial, test_input)
+                    pending[future] = group, test_input, probe
+                    group.in_flight += 1
+                # a group waiting for enough free CPUs keeps its turn
+                if wants(group) and not has_room(group):
+                    break
+
+            if pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    group, test_input, probe = pending.pop(future)
+                    group.in_flight -= 1
+                    if budget is not None:
+                        budget.give(test_input["cpus"])
+                    try:
+                        result, seconds, timing = future.result()
+                    except Exception as e:
+                        group.fail(e)
+                        continue
+                    results = result if test_input.get("repeat") else [result]
+                    if probe:
+                        tuners[group].record(len(test_input["cpus"]), seconds / len(results))
+                    elif group.error is None:
+                        # a session that produced fewer trials than asked for leaves the rest to be sampled again
+                        group.submitted -= (test_input.get("repeat") or 1) - len(results)
+                        try:
+                            for one in results:
+                                group.complete(one, seconds / len(results))
+                                group.log(one)
+                            group.log_timing(timing)
+                        except Exception as e:
+                            group.fail(e)
+                            continue
+                        finished += len(results)
+                        print(finished, end=", ", flush=True)
+
+            for group in list(order):
+                if probing(group) and group.in_flight == 0 and not wants(group) and group.error is None:
+                    tuned(group)
+                if group.in_flight == 0 and not wants(group):
+                    finalize(group)
+    return groups
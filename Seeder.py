@@ -1,6 +1,8 @@
 import ast
 import argparse
-import pickle
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from ast_store import AstStore, open_store
 
 RANDOM_SEEDS = {"random.seed"}
 NUMPY_SEEDS = {"numpy.random.seed", "numpy.random.set_state", "numpy.random.default_rng",
@@ -11,52 +13,138 @@ TORCH_SEEDS = {"torch.seed", "torch.manual_seed", "torch.set_rng_state",
                "torch.cuda.seed", "torch.cuda.seed_all", 
                "torch.cuda.manual_seed", "torch.cuda.manual_seed_all"}
 TENSORFLOW_SEEDS = {"tensorflow.random.set_seed", "tensorflow.compat.v1.set_random_seed", "tensorflow.keras.utils.set_random_seed"}
+DEFAULT_SEED_APIS = RANDOM_SEEDS | NUMPY_SEEDS | TORCH_SEEDS | TENSORFLOW_SEEDS
 
-def resolve_func(call_node):
+def seed_api_list(value):
+    # "all" is every default API, i.e. what remove_seed strips without overrides
+    if value.strip() == "all":
+        return set(DEFAULT_SEED_APIS)
+    return set(item.strip() for item in value.split(",") if item.strip())
+
+def build_trie(seed_apis):
+    # dotted-prefix trie: an API matches a call whose resolved name starts with all of its parts
+    trie = {}
+    for api in seed_apis:
+        node = trie
+        for part in api.split("."):
+            node = node.setdefault(part, {})
+        node[None] = api
+    return trie
+
+def match_trie(trie, parts):
+    node = trie
+    for part in parts:
+        node = node.get(part)
+        if node is None:
+            return None
+        if None in node:
+            return node[None]
+    return None
+
+def call_parts(call_node):
     parts = []
     obj = call_node.func
-
     while isinstance(obj, ast.Attribute):
         parts.append(obj.attr)
         obj = obj.value
     if isinstance(obj, ast.Name):
         parts.append(obj.id)
-    
-    if not parts:
-        return ""
     parts.reverse()
+    return parts
+
+class Scope:
+    # imports bound in one function (or the module); classes do not enclose their methods
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.aliases = {}
 
-    if parts[0] in ALIAS_MAP:
-        parts[0] = ALIAS_MAP[parts[0]]
+    def resolve(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.aliases:
+                return scope.aliases[name]
+            scope = scope.parent
+            while isinstance(scope, ClassScope):
+                scope = scope.parent
+        return name
 
-    return ".".join(parts)
+class ClassScope(Scope):
+    pass
 
-def update_alias(import_node):
-    if isinstance(import_node, ast.Import):
-        for alias in import_node.names:
-            local = alias.asname or alias.name.split('.')[0]
-            ALIAS_MAP[local] = alias.name
+class SeedFinder(ast.NodeVisitor):
+    # one pass over the tree: imports are recorded in the scope they bind in and calls are
+    # resolved once the whole file is seen, so imports below a function still apply to it
+    def __init__(self, trie):
+        self.trie = trie
+        self.module = Scope()
+        self.scope = self.module
+        self.calls = []
 
-    elif isinstance(import_node, ast.ImportFrom):
-        module = import_node.module or ""
-        for alias in import_node.names:
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname:
+                self.scope.aliases[alias.asname] = alias.name
+            else:
+                # `import a.b` binds `a`, not `a.b`
+                top = alias.name.split(".")[0]
+                self.scope.aliases[top] = top
+
+    def visit_ImportFrom(self, node):
+        module = node.module or ""
+        for alias in node.names:
             local = alias.asname or alias.name
-            full = f"{module}.{alias.name}" if module else alias.name
-            ALIAS_MAP[local] = full
-
-def get_seed_lines(tree):
-    for node in ast.walk(tree):
-        if isinstance(node, (ast.Import, ast.ImportFrom)):
-            update_alias(node)
-
-    seed_lines = []
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Call):
-            fqn = resolve_func(node)
-            if any(fqn.startswith(seed) for seed in ALL_SEED_APIS):
-                seed_lines.append(node.lineno)
-    
-    return seed_lines
+            self.scope.aliases[local] = f"{module}.{alias.name}" if module else alias.name
+
+    def visit_function(self, node):
+        for child in node.decorator_list + [node.args] + ([node.returns] if node.returns else []):
+            self.visit(child)
+        outer = self.scope
+        self.scope = Scope(outer)
+        for stmt in node.body:
+            self.visit(stmt)
+        self.scope = outer
+
+    visit_FunctionDef = visit_AsyncFunctionDef = visit_function
+
+    def visit_Lambda(self, node):
+        self.visit(node.args)
+        outer = self.scope
+        self.scope = Scope(outer)
+        self.visit(node.body)
+        self.scope = outer
+
+    def visit_ClassDef(self, node):
+        for child in node.decorator_list + node.bases + node.keywords:
+            self.visit(child)
+        outer = self.scope
+        self.scope = ClassScope(outer)
+        for stmt in node.body:
+            self.visit(stmt)
+        self.scope = outer
+
+    def visit_Call(self, node):
+        parts = call_parts(node)
+        if parts:
+            self.calls.append((self.scope, parts, node.lineno))
+        self.generic_visit(node)
+
+    def findings(self):
+        # (line, fqn, api) of every call to a seeding API
+        found = []
+        for scope, parts, lineno in self.calls:
+            fqn = ".".join([scope.resolve(parts[0])] + parts[1:])
+            api = match_trie(self.trie, fqn.split("."))
+            if api is not None:
+                found.append((lineno, fqn, api))
+        return found
+
+def find_seeds(tree, seed_apis=DEFAULT_SEED_APIS, trie=None):
+    finder = SeedFinder(trie if trie is not None else build_trie(seed_apis))
+    finder.visit(tree)
+    return finder.findings()
+
+def get_seed_lines(tree, seed_apis=DEFAULT_SEED_APIS):
+    return [line for line, _, _ in find_seeds(tree, seed_apis)]
 
 def unseed(seed_lines, path):
     with open(path, "r", encoding="utf-8") as f:
@@ -76,12 +164,56 @@ def unseed(seed_lines, path):
         f.writelines(new_lines)
     return new_lines
 
+class SeedStripper(ast.NodeTransformer):
+    # in-memory counterpart of unseed(): statements on seeding lines become `pass`
+    def __init__(self, seed_lines):
+        super().__init__()
+        self.seed_lines = set(seed_lines)
+
+    def visit(self, node):
+        if isinstance(node, (ast.Expr, ast.Assign, ast.AnnAssign, ast.AugAssign)) and node.lineno in self.seed_lines:
+            return ast.copy_location(ast.Pass(), node)
+        return super().visit(node)
+
+def strip_seeds(tree, seed_apis):
+    return SeedStripper(get_seed_lines(tree, seed_apis)).visit(tree)
+
+_seed_job = None
+
+def open_seed_job(store_root, reparse, seed_apis, write):
+    global _seed_job
+    _seed_job = (AstStore(store_root, reparse=reparse, cache_size=1), build_trie(seed_apis), write)
+
+def seed_entry(path):
+    asts, trie, write = _seed_job
+    found = find_seeds(asts[path], trie=trie)
+    if write and found:
+        unseed({line for line, _, _ in found}, path)
+    return [(path, line, fqn, api) for line, fqn, api in found]
+
+def remove_seeds(asts, seed_apis, write=True, max_workers=None):
+    # yields (path, line, fqn, api) per seeding call, unseeding each file as it goes
+    paths = list(asts)
+    if isinstance(asts, AstStore):
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=open_seed_job,
+                                 initargs=(asts.root, asts.reparse, seed_apis, write)) as executor:
+            yield from zip(paths, executor.map(seed_entry, paths, chunksize=8))
+    else:
+        trie = build_trie(seed_apis)
+        for path in paths:
+            found = find_seeds(asts[path], trie=trie)
+            if write and found:
+                unseed({line for line, _, _ in found}, path)
+            yield path, [(path, line, fqn, api) for line, fqn, api in found]
+
 if __name__ == "__main__":
     p = argparse.ArgumentParser(description="Seeder CLI")
     sub = p.add_subparsers(dest="cmd", required=True)
 
     c = sub.add_parser("remove_seed", help="Commend seeding lines")
     c.add_argument("--asts-in", required=True)
+    c.add_argument("--reparse", action="store_true",
+                   help="Parse the source files instead of loading the stored ASTs")
     for name, default in [
         ("random-seeds",     RANDOM_SEEDS),
         ("numpy-seeds",      NUMPY_SEEDS),
@@ -98,28 +230,31 @@ if __name__ == "__main__":
         required=False,
         default=None,
         help="If set, overrides the specific --*-seeds lists")
+    c.add_argument("--workers", required=False, default=None, type=int)
+    c.add_argument("--findings-out", required=False, default=None,
+                   help="CSV of every seeding call found (filepath, line_number, fqn, seed_api)")
+    c.add_argument("--report-only", action="store_true",
+                   help="Only report the seeding calls; leave the files unchanged")
     
     args = p.parse_args()
 
     if args.all_seeds is not None:
-        ALL_SEED_APIS = args.all_seeds
+        seed_apis = args.all_seeds
     else:
-        ALL_SEED_APIS = args.random_seeds | args.numpy_seeds | args.torch_seeds | args.tensorflow_seeds
-    print(f"Using seeds: {','.join(sorted(ALL_SEED_APIS))}...")
+        seed_apis = args.random_seeds | args.numpy_seeds | args.torch_seeds | args.tensorflow_seeds
+    print(f"Using seeds: {','.join(sorted(seed_apis))}...")
 
-    with open(args.asts_in, "rb") as f: asts = pickle.load(f)
+    asts = open_store(args.asts_in, reparse=args.reparse)
     
     if args.cmd == "remove_seed":
-        print(f"Analyzing {len(asts.items())} python files...")
-        for (path, tree) in asts.items():
-            print(f"Processing {path}... ", end='')
-            ALIAS_MAP = {}
-            hits = get_seed_lines(tree)
-            unseed(hits, path)
-            print(f"Found {len(hits)} seed lines in {path}")
-            
-
-    
-
-
-
+        print(f"Analyzing {len(asts)} python files...")
+        findings = []
+        for path, found in remove_seeds(asts, seed_apis, write=not args.report_only, max_workers=args.workers):
+            print(f"Found {len(found)} seed lines in {path}")
+            findings += found
+        if args.findings_out:
+            with open(args.findings_out, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["filepath", "line_number", "fqn", "seed_api"])
+                writer.writerows(findings)
+        print(f"{len(findings)} seeding calls in {len({row[0] for row in findings})} files")
@@ -1,140 +1,219 @@
 import argparse
+import os
 import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-def merge_txt_files(src_paths, dest_path, verbose=False):
+from online_stats import STATS_FILE, load_stats, save_stats
+from result_store import INDEX, ResultStore, copy_range
+
+# Merges the per-worker output dirs of an array job. Every worker dir is
+# walked once into an index; groups are then merged independently on a
+# thread pool, with the bytes concatenated by the kernel (copy_file_range /
+# sendfile) rather than read and rewritten in Python. The running stats in
+# data/stats.json are combined too, so merged summaries need no raw samples.
+
+PLOT_DIRS = ("plot", "plots")
+
+def param_of(path):
+    # data/_<expected>_<param>.txt and plot/_<expected>_<param>.png
+    return path.stem.split('_')[-1]
+
+def scan_worker(worker):
+    # one walk over a worker dir: seed configs per test, data/*.txt and plot files by (test, seed)
+    # and parametrization, and every other file (relative), to copy from the template
+    index = {"seeds": {}, "data": {}, "plots": {}, "stats": {}, "files": []}
+    for dirpath, dirnames, filenames in os.walk(worker):
+        rel = Path(dirpath).relative_to(worker)
+        parts = rel.parts
+        if len(parts) == 1:
+            index["seeds"][parts[0]] = set(dirnames)
+        if len(parts) >= 3 and (parts[2] == "data" or parts[2] in PLOT_DIRS):
+            if len(parts) == 3:
+                kind = "data" if parts[2] == "data" else "plots"
+                files = index[kind].setdefault(parts[:2], {})
+                for name in filenames:
+                    path = Path(dirpath) / name
+                    if kind == "data" and name == STATS_FILE:
+                        index["stats"][parts[:2]] = path
+                    elif kind == "plots" or path.suffix == ".txt":
+                        files.setdefault(param_of(path), []).append(path)
+            continue
+        index["files"] += [rel / name for name in filenames]
+    return index
+
+def concat_files(src_paths, dest_path, verbose=False):
     if verbose:
         print(f"  → Merging {len(src_paths)} files into {dest_path}")
     dest_path.parent.mkdir(parents=True, exist_ok=True)
-    with dest_path.open('w') as fout:
+    with open(dest_path, "wb") as fout:
         for p in src_paths:
-            if not p.exists():
-                print(f"    ! WARNING: {p} does not exist", file=sys.stderr)
-                continue
+            with open(p, "rb") as fin:
+                copy_range(fin.fileno(), fout.fileno(), 0, os.fstat(fin.fileno()).st_size)
+
+def copy_file(src, dest, verbose=False):
+    if verbose:
+        print(f"  • copy {src} → {dest}")
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copy2(src, dest)
+
+def copy_plots(template, template_index, out_dir, test, seed, params, verbose=False):
+    plots = template_index["plots"].get((test, seed), {})
+    for param in params:
+        for plot_file in plots.get(str(param), [])[:1]:
+            copy_file(plot_file, out_dir / plot_file.relative_to(template), verbose)
+
+def merge_stats_group(indexes, out_dir, test, seed, verbose=False):
+    # streaming summaries combine exactly, so the merged stats never touch the raw samples
+    paths = [index["stats"].get((test, seed)) for index in indexes]
+    if any(path is None for path in paths):
+        if verbose and any(paths):
+            print(f"    ! not merging {test}/{seed} stats: {STATS_FILE} missing in some workers")
+        return 0
+    stats, expected = load_stats(paths[0])
+    for path in paths[1:]:
+        other, _ = load_stats(path)
+        for param in list(stats):
+            if param in other:
+                stats[param].merge(other[param])
+            else:
+                del stats[param]
+    dest = out_dir / test / seed / "data"
+    dest.mkdir(parents=True, exist_ok=True)
+    save_stats(dest / STATS_FILE, stats, expected)
+    return len(stats)
+
+def merge_store_group(out, stores, per_worker, test, seed, verbose=False):
+    template_rows = per_worker[0].get((test, seed))
+    if not template_rows:
+        if verbose:
+            print(f"  • skipping {test}/{seed}: not in the template index")
+        return {}
+    sources, expected = {}, {}
+    for param, row in template_rows.items():
+        parts = [(store, groups.get((test, seed), {}).get(param)) for store, groups in zip(stores, per_worker)]
+        missing = [store.root for store, match in parts if match is None]
+        if missing:
+            if verbose:
+                print(f"    ! skipping {test}/{seed} idx={param}: missing in {missing}")
+            continue
+        sources[param] = parts
+        expected[param] = row["expected"]
+    if verbose:
+        print(f"  → Merging {len(sources)} series of {test}/{seed} from {len(stores)} workers")
+    return out.merge_group(test, seed, sources, expected) if sources else {}
+
+def merge_stores(workers, out_dir, tests_and_seeds, template_index, verbose=False, jobs=None):
+    print("\nAggregating binary result stores:")
+    stores = [ResultStore(w) for w in workers]
+    out = ResultStore(out_dir)
+    # one pass over each index: (test, seed) -> {param: row}
+    per_worker = [{key: {row["param"]: row for row in rows} for key, rows in store.groups().items()}
+                  for store in stores]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        merged = {(test, seed): executor.submit(merge_store_group, out, stores, per_worker, test, seed, verbose)
+                  for test, seeds in tests_and_seeds.items() for seed in seeds}
+        copies = []
+        for (test, seed), future in merged.items():
+            rows = future.result()
+            out.rows.update(rows)
+            copies.append(executor.submit(copy_plots, workers[0], template_index, out_dir, test, seed,
+                                          [param for _, _, param in rows], verbose))
+        for future in copies:
+            future.result()
+    out.save()
+    print(f"Wrote {len(out)} series to {out_dir / INDEX}")
+
+def merge_text_group(workers, indexes, out_dir, test, seed, verbose=False):
+    template_data = indexes[0]["data"].get((test, seed))
+    if not template_data:
+        if verbose:
+            print(f"  • skipping {test}/{seed}: no data files in the template")
+        return []
+    merged = []
+    for idx, template_files in template_data.items():
+        src_txts = [index["data"].get((test, seed), {}).get(idx, []) for index in indexes]
+        counts = [len(files) for files in src_txts]
+        if any(count != 1 for count in counts):
             if verbose:
-                print(f"    • reading {p}")
-            with p.open('r') as fin:
-                for line in fin:
-                    fout.write(line)
+                print(f"    ! skipping {test}/{seed} idx={idx}: found {counts} matches across workers")
+            continue
+        # use the template filename for the output path
+        concat_files([files[0] for files in src_txts], out_dir / template_files[0].relative_to(workers[0]), verbose)
+        merged.append(idx)
+    copy_plots(workers[0], indexes[0], out_dir, test, seed, merged, verbose)
+    return merged
 
-def main(workers_dir: Path, out_dir: Path, verbose=False):
-    # 0) discover worker dirs
+def main(workers_dir: Path, out_dir: Path, verbose=False, jobs=None):
+    # 0) discover worker dirs and index each of them once
     workers = sorted(d for d in workers_dir.iterdir() if d.is_dir())
     print(f"Found {len(workers)} workers: {[w.name for w in workers]}")
     if not workers:
         print(f"ERROR: no subdirectories in {workers_dir}", file=sys.stderr)
         sys.exit(1)
     template = workers[0]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        indexes = list(executor.map(scan_worker, workers))
 
     # 1) find tests present in every worker
-    tests_per_worker = [
-        {p.name for p in w.iterdir() if p.is_dir()}
-        for w in workers
-    ]
-    common_tests = set.intersection(*tests_per_worker)
+    common_tests = set.intersection(*(set(index["seeds"]) for index in indexes))
 
-    # 2) filter to tests where each worker has exactly 3 seeds, same names
+    # 2) merge the seed configs every worker ran for the test, however many there are
     tests_and_seeds = {}
     for test in sorted(common_tests):
-        seed_sets = []
-        for w in workers:
-            test_dir = w / test
-            if not test_dir.is_dir():
-                seed_sets = []
-                break
-            seeds = {p.name for p in test_dir.iterdir() if p.is_dir()}
-            if len(seeds) != 3:
-                seed_sets = []
-                break
-            seed_sets.append(seeds)
-        if not seed_sets:
+        seed_sets = [index["seeds"][test] for index in indexes]
+        seeds = set.intersection(*seed_sets)
+        if verbose and any(s != seeds for s in seed_sets):
+            print(f"Test '{test}': only merging the seed configs all workers have ({sorted(seeds)})")
+        if not seeds:
             if verbose:
-                print(f"Skipping test '{test}': missing or wrong number of seed configs")
+                print(f"Skipping test '{test}': no seed config common to all workers")
             continue
-        # all seed-sets must be identical
-        if not all(seeds == seed_sets[0] for seeds in seed_sets):
-            if verbose:
-                print(f"Skipping test '{test}': seed-config names differ across workers")
-            continue
-        tests_and_seeds[test] = sorted(seed_sets[0])
+        tests_and_seeds[test] = sorted(seeds)
 
     if not tests_and_seeds:
-        print("ERROR: no tests with all 3 seed-configs present; nothing to merge", file=sys.stderr)
+        print("ERROR: no tests with a seed config present in every worker; nothing to merge", file=sys.stderr)
         sys.exit(1)
 
     print(f"Will merge these tests: {list(tests_and_seeds.keys())}")
 
-    # 3) copy non-data, non-plot files/folders from template (only for kept tests)
+    # 3) copy non-data, non-plot files from the template (only for kept tests and seeds)
     print("\nCopying non-data files/folders:")
-    for src in template.rglob('*'):
-        # skip any data or plots content
-        if 'data' in src.parts or 'plots' in src.parts:
-            continue
-        rel = src.relative_to(template)
-        # if this is under a test that we're not including, skip it
-        if rel.parts and rel.parts[0] in common_tests and rel.parts[0] not in tests_and_seeds:
-            continue
-        dest = out_dir / rel
-        if src.is_dir():
-            if verbose:
-                print(f"  • mkdir {dest}")
-            dest.mkdir(parents=True, exist_ok=True)
-        else:
-            dest.parent.mkdir(parents=True, exist_ok=True)
-            if verbose:
-                print(f"  • copy {src} → {dest}")
-            shutil.copy2(src, dest)
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = []
+        for rel in indexes[0]["files"]:
+            if rel == Path(INDEX):
+                continue
+            if rel.parts[0] in common_tests and rel.parts[0] not in tests_and_seeds:
+                continue
+            if len(rel.parts) > 2 and rel.parts[0] in tests_and_seeds and rel.parts[1] not in tests_and_seeds[rel.parts[0]]:
+                continue
+            futures.append(executor.submit(copy_file, template / rel, out_dir / rel, verbose))
+        for future in futures:
+            future.result()
 
     # 4) aggregate only the common tests & seeds, matching parametrizations by index
-    print("\nAggregating .txt data files and one plot per parametrization:")
-    for test, seeds in tests_and_seeds.items():
-        for seed in seeds:
-            data_dir = template / test / seed / 'data'
-            plot_dir = template / test / seed / 'plots'
-            if not data_dir.is_dir():
-                if verbose:
-                    print(f"  • skipping missing data dir {data_dir}")
-                continue
+    if all((w / INDEX).exists() for w in workers):
+        merge_stores(workers, out_dir, tests_and_seeds, indexes[0], verbose=verbose, jobs=jobs)
+    else:
+        print("\nAggregating .txt data files and one plot per parametrization:")
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(merge_text_group, workers, indexes, out_dir, test, seed, verbose)
+                       for test, seeds in tests_and_seeds.items() for seed in seeds]
+            merged = sum(len(future.result()) for future in futures)
+        print(f"Merged {merged} parametrizations")
 
-            # collect all parametrization indices from the template data folder
-            indices = [p.stem.split('_')[-1] for p in data_dir.glob('*.txt')]
-
-            for idx in indices:
-                # 4a) gather the .txt files for this index from every worker
-                src_txts = []
-                for w in workers:
-                    dd = w / test / seed / 'data'
-                    matches = [p for p in dd.glob('*.txt') if p.stem.split('_')[-1] == idx]
-                    if len(matches) == 1:
-                        src_txts.append(matches[0])
-                    else:
-                        if verbose:
-                            print(f"    ! skipping {test}/{seed} idx={idx}: found {len(matches)} matches in {dd}")
-                        src_txts = []
-                        break
-                if not src_txts:
-                    continue
-
-                # use the template filename for the output path
-                template_file = next(p for p in data_dir.glob('*.txt') if p.stem.split('_')[-1] == idx)
-                rel_txt = template_file.relative_to(template)
-                merge_txt_files(src_txts, out_dir / rel_txt, verbose=verbose)
-
-                # 4b) copy the first plot for this index from the template
-                if plot_dir.is_dir():
-                    plot_file = next((p for p in plot_dir.iterdir() if p.stem.split('_')[-1] == idx), None)
-                    if plot_file:
-                        rel_plot = plot_file.relative_to(template)
-                        dest_plot = out_dir / rel_plot
-                        dest_plot.parent.mkdir(parents=True, exist_ok=True)
-                        if verbose:
-                            print(f"    • copy plot {plot_file} → {dest_plot}")
-                        shutil.copy2(plot_file, dest_plot)
+    # 5) combine the streaming summaries the samplers left next to the data
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(merge_stats_group, indexes, out_dir, test, seed, verbose)
+                   for test, seeds in tests_and_seeds.items() for seed in seeds]
+        summarized = sum(future.result() for future in futures)
+    print(f"Merged running stats of {summarized} series")
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
-        description="Merge worker_* result dirs into one, aggregating data/*.txt"
+        description="Merge worker_* result dirs into one, aggregating their result stores (or data/*.txt)"
     )
     parser.add_argument('-w', '--workers-dir', required=True, type=Path,
                         help="parent dir containing worker subdirs (e.g. '0','1',...)")
@@ -142,5 +221,7 @@ if __name__ == '__main__':
                         help="directory to write merged output")
     parser.add_argument('-v', '--verbose', action='store_true',
                         help="print each file/folder as it’s processed")
+    parser.add_argument('-j', '--jobs', default=None, type=int,
+                        help="merges and copies run in parallel (default: the thread pool default)")
     args = parser.parse_args()
-    main(args.workers_dir, args.out_dir, verbose=args.verbose)
+    main(args.workers_dir, args.out_dir, verbose=args.verbose, jobs=args.jobs)
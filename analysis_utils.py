@@ -1,12 +1,91 @@
+import os
 import numpy as np
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from scipy.stats import skew, kurtosis
 
-def compile_param_stats(root_dir, save_csv = None) -> pd.DataFrame:
-    root = Path(root_dir).expanduser().resolve()
-    rows = []
-
+from online_stats import STATS_FILE, load_stats
+from result_store import INDEX, ResultStore
+
+def param_stats(data, test_name, seed_cfg, param_tag, expected, path_txt, path_png):
+    n       = data.size
+    mean    = data.mean()
+    var     = data.var(ddof=0)
+    q25, q75 = np.percentile(data, [25, 75])
+    data_skew     = skew(data)
+    data_kurtosis = kurtosis(data, fisher=True, bias=False)
+
+    return dict(
+        test_name=test_name,
+        seed_cfg=seed_cfg,
+        param_tag=param_tag,
+        expected=expected,
+        n=n,
+        mean=mean,
+        var=var,
+        q25=q25,
+        q75=q75,
+        min=data.min(),
+        max=data.max(),
+        skew=data_skew,
+        kurtosis=data_kurtosis,
+        path_txt=path_txt,
+        path_png=path_png,
+    )
+
+# Per-series stats are cached in <root>/param_stats_cache.csv, keyed by the
+# source file's path, mtime and size (and the series' offset in a store file),
+# so re-running only loads and reduces the series that are new or changed.
+STATS_CACHE = "param_stats_cache.csv"
+KEY_COLS = ["source", "offset", "mtime_ns", "size"]
+STAT_COLS = ["n", "mean", "var", "q25", "q75", "min", "max", "skew", "kurtosis"]
+
+def batch_stats(batch):
+    # the param_stats numbers for every row of a (series, trials) array at once
+    q25, q75 = np.percentile(batch, [25, 75], axis=1)
+    return dict(
+        n=np.full(batch.shape[0], batch.shape[1]),
+        mean=batch.mean(axis=1),
+        var=batch.var(axis=1, ddof=0),
+        q25=q25,
+        q75=q75,
+        min=batch.min(axis=1),
+        max=batch.max(axis=1),
+        skew=skew(batch, axis=1),
+        kurtosis=kurtosis(batch, axis=1, fisher=True, bias=False),
+    )
+
+def ragged_stats(series):
+    # series of the same length are stacked and reduced together; one dict of stats per series
+    by_len = {}
+    for i, data in enumerate(series):
+        by_len.setdefault(data.size, []).append(i)
+    out = [None] * len(series)
+    for size, idxs in by_len.items():
+        if size == 0:
+            for i in idxs:
+                out[i] = dict.fromkeys(STAT_COLS, np.nan) | {"n": 0}
+            continue
+        stats = batch_stats(np.stack([series[i] for i in idxs]))
+        for j, i in enumerate(idxs):
+            out[i] = {col: stats[col][j] for col in STAT_COLS}
+    return out
+
+def store_entries(root):
+    store = ResultStore(root)
+    entries = []
+    for row in store:
+        tag = f"_{row['expected']}_{row['param']}"
+        meta = dict(test_name=row["test_name"], seed_cfg=row["seed_cfg"],
+                    param_tag=f"_{row['expected']}-p{row['param']}", expected=row["expected"],
+                    path_txt=str(root / row["file"]),
+                    path_png=str(root / row["test_name"] / row["seed_cfg"] / "plot" / f"{tag}.png"))
+        entries.append((meta, root / row["file"], row["offset"], row["n"]))
+    return entries
+
+def text_entries(root):
+    entries = []
     for txt_path in root.rglob("*.txt"):
         rel_parts = txt_path.relative_to(root).parts
         if len(rel_parts) < 3:
@@ -17,40 +96,62 @@ def compile_param_stats(root_dir, save_csv = None) -> pd.DataFrame:
         if len(stem_parts) < 2:
             continue
         expected_val, param_idx = stem_parts[0], stem_parts[-1]
-        param_tag = f"{expected_val}-p{param_idx}"
-
-        data = np.loadtxt(txt_path, dtype=float)
-        if data.size == 0:
-            continue
-
-        n       = data.size
-        mean    = data.mean()
-        var     = data.var(ddof=0)
-        q25, q75 = np.percentile(data, [25, 75])
-        data_skew     = skew(data)
-        data_kurtosis = kurtosis(data, fisher=True, bias=False)
-
-        rows.append(
-            dict(
-                test_name=test_name,
-                seed_cfg=seed_cfg,
-                param_tag=param_tag,
-                expected=float(expected_val[1:]),
-                n=n,
-                mean=mean,
-                var=var,
-                q25=q25,
-                q75=q75,
-                min=data.min(),
-                max=data.max(),
-                skew=data_skew,
-                kurtosis=data_kurtosis,
-                path_txt=str(txt_path),
-                path_png=str(txt_path.with_suffix(".png")),
-            )
-        )
-
-    df = pd.DataFrame(rows)
+        meta = dict(test_name=test_name, seed_cfg=seed_cfg, param_tag=f"{expected_val}-p{param_idx}",
+                    expected=float(expected_val[1:]), path_txt=str(txt_path), path_png=str(txt_path.with_suffix(".png")))
+        entries.append((meta, txt_path, 0, None))
+    return entries
+
+def load_series(entries, workers=None):
+    # store files are read once each and sliced; text files are parsed one per task
+    by_source = {}
+    for entry in entries:
+        by_source.setdefault(entry[1], []).append(entry)
+
+    def load_file(source):
+        if by_source[source][0][3] is None:
+            return [np.loadtxt(source, dtype=float, ndmin=1)]
+        values = np.fromfile(source, dtype="<f8")
+        return [values[offset:offset + n] for _, _, offset, n in by_source[source]]
+
+    series = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for file_entries, loaded in zip(by_source.values(), executor.map(load_file, by_source)):
+            for (_, source, offset, _), data in zip(file_entries, loaded):
+                series[(source, offset)] = data
+    return [series[(source, offset)] for _, source, offset, _ in entries]
+
+def read_stats_cache(path):
+    if not path.exists():
+        return {}
+    cached = pd.read_csv(path, float_precision="round_trip")
+    return {tuple(r[:4]): dict(zip(STAT_COLS, r[4:])) for r in cached[KEY_COLS + STAT_COLS].itertuples(index=False)}
+
+def compile_param_stats(root_dir, save_csv = None, workers=None, cache=True) -> pd.DataFrame:
+    root = Path(root_dir).expanduser().resolve()
+    entries = store_entries(root) if (root / INDEX).exists() else text_entries(root)
+
+    stamps = {}
+    for _, source, _, _ in entries:
+        if source not in stamps:
+            st = os.stat(source)
+            stamps[source] = (st.st_mtime_ns, st.st_size)
+    keys = [(str(source), offset) + stamps[source] for _, source, offset, _ in entries]
+
+    cache_path = root / STATS_CACHE
+    cached = read_stats_cache(cache_path) if cache else {}
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    if missing:
+        fresh = ragged_stats(load_series([entries[i] for i in missing], workers))
+        cached.update((keys[i], stats) for i, stats in zip(missing, fresh))
+        print(f"Computed stats for {len(missing)} series, {len(entries) - len(missing)} from cache")
+    if cache:
+        pd.DataFrame([dict(zip(KEY_COLS, key)) | cached[key] for key in keys],
+                     columns=KEY_COLS + STAT_COLS).to_csv(cache_path, index=False)
+
+    rows = [meta | cached[key] for (meta, _, _, _), key in zip(entries, keys) if cached[key]["n"] > 0]
+    df = pd.DataFrame(rows, columns=["test_name", "seed_cfg", "param_tag", "expected"] + STAT_COLS
+                      + ["path_txt", "path_png"])
+    df["n"] = df["n"].astype(int)
 
     dup_mask = df.duplicated(subset=["test_name", "seed_cfg", "param_tag"])
     if dup_mask.any():
@@ -70,6 +171,31 @@ def compile_param_stats(root_dir, save_csv = None) -> pd.DataFrame:
 
     return df
 
+def compile_summary_stats(root_dir, save_csv=None) -> pd.DataFrame:
+    # the param_stats moments from the samplers' streaming summaries (data/stats.json), without reading
+    # any raw samples. The sketch's quantiles are only accurate relative to the values' magnitude, which
+    # says little about low-variance metrics, so q25/q75 are left to compile_param_stats.
+    root = Path(root_dir).expanduser().resolve()
+    columns = [col for col in STAT_COLS if col not in ("q25", "q75")] + ["tail_z"]
+    rows = []
+    for stats_path in sorted(root.glob(f"*/*/data/{STATS_FILE}")):
+        test_name, seed_cfg = stats_path.relative_to(root).parts[:2]
+        stats, expected = load_stats(stats_path)
+        for param, running in stats.items():
+            if running.n == 0:
+                continue
+            summary = running.summary(expected[param])
+            rows.append(dict(test_name=test_name, seed_cfg=seed_cfg,
+                             param_tag=f"_{expected[param]}-p{param}", expected=expected[param])
+                        | {col: summary[col] for col in columns})
+    df = pd.DataFrame(rows, columns=["test_name", "seed_cfg", "param_tag", "expected"] + columns)
+
+    if save_csv:
+        df.to_csv(save_csv, index=False)
+        print(f"Saved: {save_csv}")
+
+    return df
+
 def slice_by_param(df, param, constraint) -> pd.DataFrame:
     sub = df.loc[df[param] == constraint].copy().reset_index(drop=True)
 
@@ -0,0 +1,144 @@
+import ast
+import hashlib
+import json
+import os
+import pickle
+import sys
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+
+# On-disk store of per-file pickles: <root>/index.json maps each key (a source
+# path) to an object under <root>/objects/, and entries are only unpickled when
+# looked up. ASTs are named by the hash of their source, so re-compiling an
+# updated checkout only writes the files that changed. The source text is kept
+# next to each AST; a missing object is re-parsed from the source path.
+
+INDEX = "index.json"
+# written next to the funcs index by the miner: path -> {"CLS.TST": node path in the file's AST}
+LOCATIONS = "locations.json"
+VERSION = 1
+
+def source_key(data):
+    # pickled ASTs are only valid for the interpreter version that parsed them
+    return hashlib.sha256(f"{sys.version_info[:2]}".encode() + data).hexdigest()
+
+def parse_source(path):
+    return ast.parse(Path(path).read_bytes().decode(), filename=str(path))
+
+def write_bytes(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def write_object(path, value):
+    write_bytes(path, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+class PickleStore(Mapping):
+    def __init__(self, root, reparse=False, cache_size=64):
+        self.root = Path(root)
+        self.reparse = reparse
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.entries = {}
+        if (self.root / INDEX).exists():
+            with open(self.root / INDEX) as f:
+                index = json.load(f)
+            if index.get("version") != VERSION:
+                raise RuntimeError("Unsupported store version", str(self.root), index.get("version"))
+            self.entries = index["entries"]
+
+    def object_path(self, name):
+        return self.root / "objects" / name[:2] / f"{name}.pickle"
+
+    def source_path(self, name):
+        return self.root / "objects" / name[:2] / f"{name}.py"
+
+    def __getitem__(self, key):
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        name = self.entries[key]
+        path = self.object_path(name)
+        if self.reparse or not path.exists():
+            value = self.load_missing(key)
+        else:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    def load_missing(self, key):
+        raise KeyError(key, "object missing from store", str(self.root))
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def put(self, key, value, name=None):
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        name = name or hashlib.sha256(data).hexdigest()
+        path = self.object_path(name)
+        if not path.exists():
+            write_bytes(path, data)
+        self.entries[key] = name
+        self._cache.pop(key, None)
+        return name
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f"{INDEX}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"version": VERSION, "entries": self.entries}, f, indent=0, sort_keys=True)
+        os.replace(tmp, self.root / INDEX)
+
+    def prune(self):
+        # drop objects no longer referenced by the index
+        used = set(self.entries.values())
+        removed = 0
+        for path in self.root.glob("objects/*/*"):
+            if path.suffix in (".pickle", ".py") and path.stem not in used:
+                path.unlink()
+                removed += 1
+        return removed
+
+class AstStore(PickleStore):
+    def load_missing(self, key):
+        return parse_source(key)
+
+    def source(self, key):
+        # the text the stored AST was parsed from, even if the file changed since
+        path = self.source_path(self.entries[key])
+        if self.reparse or not path.exists():
+            path = Path(key)
+        return path.read_bytes().decode()
+
+def open_store(path, reparse=False):
+    # stores are directories; a file is a pickled dict from before the store existed
+    if Path(path).is_dir():
+        return AstStore(path, reparse=reparse)
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+def save_locations(root, locations):
+    Path(root).mkdir(parents=True, exist_ok=True)
+    write_bytes(Path(root) / LOCATIONS, json.dumps(locations, sort_keys=True).encode())
+
+def open_locations(path):
+    # stores mined before the index existed (and legacy pickles) have none; callers rebuild it per file
+    path = Path(path) / LOCATIONS
+    if not path.is_file():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def open_funcs(path):
+    if Path(path).is_dir():
+        return PickleStore(path)
+    with open(path, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,209 @@
+import ast
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import yaml
+
+from Sampler import resolve_test
+
+# Content-addressed store of trial logs. An entry is keyed by what a trial's
+# outcome can depend on: the (instrumented) test file with the local modules
+# and conftest files it pulls in, the seed config and value, and the installed
+# environment. Groups restore a matching entry before sampling and only run
+# the trials it is missing; the grown log is stored back afterwards.
+
+KEY_ENV_VARS = (
+    "CUDA_VISIBLE_DEVICES",
+    "PL_TEST_DEVICE",
+    "PYRO_DEVICE",
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+)
+
+_environment = None
+_sources = {}
+
+def environment_fingerprint():
+    global _environment
+    if _environment is None:
+        freeze = subprocess.run([sys.executable, "-m", "pip", "freeze", "--all"],
+                                capture_output=True, text=True).stdout
+        # editable and local-path installs change with every commit of the repo
+        # under test; its code is already covered by the source hashes
+        packages = sorted(line for line in freeze.splitlines()
+                          if line and not line.startswith("-e ") and " @ file://" not in line)
+        _environment = {
+            "python": sys.version,
+            "packages": hashlib.sha256("\n".join(packages).encode()).hexdigest(),
+            "env": {name: os.environ.get(name) for name in KEY_ENV_VARS},
+        }
+    return _environment
+
+def count_lines(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read().count(b"\n")
+    except FileNotFoundError:
+        return 0
+
+def module_files(name, roots):
+    parts = name.split(".")
+    found = []
+    for root in roots:
+        for i in range(1, len(parts) + 1):
+            base = root.joinpath(*parts[:i])
+            for candidate in (base / "__init__.py", base.with_suffix(".py")):
+                if candidate.is_file():
+                    found.append(candidate)
+                    break
+        if found:
+            return found
+    return found
+
+def local_imports(path, project_root):
+    tree = ast.parse(path.read_bytes(), filename=str(path))
+    roots = [path.parent, project_root, project_root / "src"]
+    files = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                files += module_files(alias.name, roots)
+        elif isinstance(node, ast.ImportFrom):
+            if node.level:
+                package = path.parent
+                for _ in range(node.level - 1):
+                    package = package.parent
+                search = [package]
+            else:
+                search = roots
+            module = node.module or ""
+            for alias in node.names:
+                # `from pkg import mod` may name a submodule
+                files += module_files(".".join(p for p in (module, alias.name) if p), search)
+            if module:
+                files += module_files(module, search)
+    return [f.resolve() for f in files if f.resolve().is_relative_to(project_root)]
+
+def source_digest(path, project_root):
+    stat = path.stat()
+    cached = _sources.get(path)
+    if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1], cached[2]
+    digest = hashlib.sha256(path.read_bytes()).hexdigest()
+    try:
+        imports = local_imports(path, project_root)
+    except SyntaxError:
+        imports = []
+    _sources[path] = ((stat.st_mtime_ns, stat.st_size), digest, imports)
+    return digest, imports
+
+def source_hashes(test_path, project_root):
+    pending = [test_path]
+    directory = test_path.parent
+    while directory.is_relative_to(project_root):
+        conftest = directory / "conftest.py"
+        if conftest.is_file():
+            pending.append(conftest)
+        if directory == project_root:
+            break
+        directory = directory.parent
+
+    hashes = {}
+    while pending:
+        path = pending.pop()
+        rel = str(path.relative_to(project_root))
+        if rel in hashes:
+            continue
+        hashes[rel], imports = source_digest(path, project_root)
+        pending += imports
+    return dict(sorted(hashes.items()))
+
+def seed_config(project_root, seed_config_file, seed_config_name):
+    with open(project_root / seed_config_file) as f:
+        all_cfgs = yaml.safe_load(f)
+    subconfigs = [s.strip() for s in seed_config_name.split(",") if s.strip()]
+    return {subconfig: all_cfgs.get(subconfig) for subconfig in subconfigs}
+
+class ResultCache:
+    def __init__(self, directory, max_mb=1024):
+        self.directory = Path(directory)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, group):
+        test_input = group.test_input
+        project_root, rel = resolve_test(group.path, test_input["repo_name"])
+        project_root = project_root.resolve()
+        parts = {
+            "kind": type(group).__name__,
+            "test": [str(rel), test_input["CLASS"], test_input["TEST"]],
+            "sources": source_hashes(project_root / rel, project_root),
+            "seed_config_name": test_input["seed_config_name"],
+            "seed_config": seed_config(project_root, test_input["seed_config_file"], test_input["seed_config_name"]),
+            "seed_value": str(test_input["seed_value"]),
+            "environment": environment_fingerprint(),
+        }
+        # only present for in-memory runs, so keys of file-based runs are unchanged; the sources
+        # hashed are the original files, so the transforms applied on import stand in for them
+        if test_input.get("instrument"):
+            parts["instrument"] = test_input["lines"]
+        if test_input.get("strip_seeds"):
+            parts["strip_seeds"] = test_input["strip_seeds"]
+        # trials that share a session are only pooled with trials run the same way
+        if getattr(group, "repeat", 1) > 1:
+            parts["repeat"] = group.repeat
+        if group.threads is not None:
+            parts["threads"] = group.threads
+        digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+        return digest, parts
+
+    def entry(self, group):
+        if getattr(group, "cache_key", None) is None:
+            group.cache_key, group.cache_parts = self.key(group)
+        return self.directory / group.cache_key[:2] / group.cache_key
+
+    def restore(self, group):
+        if group.log_path is None:
+            return 0
+        log = self.entry(group) / "trials.jsonl"
+        cached = count_lines(log)
+        if cached <= count_lines(group.log_path):
+            return 0
+        shutil.copyfile(log, group.log_path)
+        os.utime(log)
+        return min(cached, group.trials)
+
+    def store(self, group):
+        if group.log_path is None or not os.path.exists(group.log_path):
+            return
+        entry = self.entry(group)
+        log = entry / "trials.jsonl"
+        if count_lines(group.log_path) > count_lines(log):
+            entry.mkdir(parents=True, exist_ok=True)
+            with open(entry / "meta.json", "w") as f:
+                json.dump({"key": group.key, **group.cache_parts}, f, indent=2)
+            tmp = entry / "trials.jsonl.tmp"
+            shutil.copyfile(group.log_path, tmp)
+            os.replace(tmp, log)
+        elif log.exists():
+            os.utime(log)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total = 0
+        for log in self.directory.glob("*/*/trials.jsonl"):
+            size = sum(f.stat().st_size for f in log.parent.iterdir())
+            entries.append((log.stat().st_mtime, size, log.parent))
+            total += size
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
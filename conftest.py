@@ -1,12 +1,26 @@
 import pytest
 import importlib
+import os
+import sys
+import time
+import types
 import yaml
 from collections import defaultdict
 
+# Resolved seed callables per (config file, mtime, config name). The cache lives in
+# its own module so it outlasts this conftest: warm workers re-import the conftest
+# for every trial, but keep the process (and so the cache) alive.
+_cache = sys.modules.setdefault("_seed_config_cache", types.ModuleType("_seed_config_cache"))
+if not hasattr(_cache, "resolved"):
+    _cache.resolved = {}
+    _cache.configs = {}
+
 def pytest_addoption(parser):
     parser.addoption("--seed-config-file",  default="seed_configs.yaml")
     parser.addoption("--seed-config-name",  default="minimal")
     parser.addoption("--seed-value",        type=int, default=0)
+    parser.addoption("--seed-timing",       action="store_true",
+                     help="Report the time spent resolving and calling the seed functions")
 
 def rec_getattr(obj, attr_path, default=None):
     current = obj
@@ -16,22 +30,25 @@ def rec_getattr(obj, attr_path, default=None):
             return default
     return current
 
-@pytest.fixture(autouse=True)
-def apply_seed_config(request):
-    cfg_file = request.config.getoption("seed_config_file")
-    cfg_name = request.config.getoption("seed_config_name")
-    seed_val = request.config.getoption("seed_value")
+def load_configs(cfg_file):
+    stat = os.stat(cfg_file)
+    key = (os.path.abspath(cfg_file), stat.st_mtime_ns, stat.st_size)
+    if key not in _cache.configs:
+        with open(cfg_file) as f:
+            _cache.configs[key] = yaml.safe_load(f)
+    return key, _cache.configs[key]
+
+def resolve_seed_config(cfg_file, cfg_name):
+    file_key, all_cfgs = load_configs(cfg_file)
+    key = file_key + (cfg_name,)
+    if key in _cache.resolved:
+        return _cache.resolved[key]
 
-    with open(cfg_file) as f:
-        all_cfgs = yaml.safe_load(f)
     try:
         subconfigs = [s.strip() for s in cfg_name.split(",") if s.strip()]
         fqn_list = [fqn for subconfig in subconfigs for fqn in all_cfgs[subconfig]]
     except KeyError:
         raise pytest.UsageError(f"Unknown seed config {cfg_name!r}")
-    
-    if not fqn_list:
-        return
 
     groups = defaultdict(list)
     for fqn in fqn_list:
@@ -54,9 +71,35 @@ def apply_seed_config(request):
         if not found_any:
             raise pytest.UsageError(f"In seed‐config {cfg_name!r}, none of {funcs} found in module {module!r}")
 
+    _cache.resolved[key] = tuple(seed_callables)
+    return _cache.resolved[key]
+
+seed_timing_key = pytest.StashKey[list]()
+
+@pytest.fixture(autouse=True)
+def apply_seed_config(request):
+    config = request.config
+    t0 = time.perf_counter()
+    seed_callables = resolve_seed_config(config.getoption("seed_config_file"), config.getoption("seed_config_name"))
+    t1 = time.perf_counter()
+    seed_val = config.getoption("seed_value")
     for fn in seed_callables:
         try:
             fn(seed_val)
         except:
             fn()
+    t2 = time.perf_counter()
+
+    timing = config.stash.setdefault(seed_timing_key, [0, 0.0, 0.0])
+    timing[0] += 1
+    timing[1] += t1 - t0
+    timing[2] += t2 - t1
+    request.node.user_properties.append(("seed_seconds", t2 - t1))
 
+def pytest_terminal_summary(terminalreporter, config):
+    timing = config.stash.get(seed_timing_key, None)
+    if timing and config.getoption("seed_timing"):
+        tests, resolving, seeding = timing
+        terminalreporter.write_line(f"seed config {config.getoption('seed_config_name')!r}: "
+                                    f"resolved in {resolving * 1000:.3f} ms, seeding took {seeding * 1000:.3f} ms "
+                                    f"over {tests} tests")
@@ -0,0 +1,139 @@
+import ast
+import fnmatch
+import hashlib
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import marshal
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+import Instrumentor
+import Seeder
+
+# pytest plugin (`-p instrument_hook`) that instruments modules as they are
+# imported instead of writing <stem>_<line>.py copies and unseeded sources
+# into the checkout. A meta path finder placed in front of pytest's own
+# assertion rewriter applies the Logger transform to the --instrument lines
+# and strips the --strip-seeds calls from every module under the rootdir,
+# then rewrites asserts like pytest would. Compiled code is cached by content,
+# in memory and under --instrument-cache, so the checkout can stay read-only.
+
+_code = {}
+_transform_digest = None
+
+def transform_digest():
+    # cached code must not outlive a change to the transforms themselves
+    global _transform_digest
+    if _transform_digest is None:
+        h = hashlib.sha256()
+        for module in (sys.modules[__name__], Instrumentor, Seeder):
+            h.update(Path(module.__file__).read_bytes())
+        _transform_digest = h.hexdigest()
+    return _transform_digest
+
+def parse_instrument(values, base):
+    targets = {}
+    for value in values or ():
+        path, _, lines = value.rpartition(":")
+        path = Path(path)
+        if not path.is_absolute():
+            path = base / path
+        targets.setdefault(str(path.resolve()), set()).update(int(l) for l in lines.split(",") if l.strip())
+    return targets
+
+class InstrumentingLoader(importlib.machinery.SourceFileLoader):
+    def __init__(self, fullname, path, finder):
+        super().__init__(fullname, path)
+        self.finder = finder
+
+    def get_code(self, fullname):
+        source = self.get_data(self.path)
+        return self.finder.compile(self.path, source)
+
+class InstrumentingFinder(importlib.abc.MetaPathFinder):
+    def __init__(self, config, targets, seed_apis, cache_dir):
+        self.config = config
+        self.targets = targets
+        self.seed_apis = seed_apis
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        # the directory pytest runs in, i.e. the project; the rootdir can be a parent of it
+        self.root = str(config.invocation_params.dir.resolve())
+        self.rewrite = config.getoption("assertmode") == "rewrite"
+        self.python_files = config.getini("python_files")
+
+    def handles(self, origin):
+        if origin in self.targets:
+            return True
+        return bool(self.seed_apis) and origin.startswith(self.root + os.sep) and "site-packages" not in origin
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = importlib.machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or not spec.has_location or not (spec.origin or "").endswith(".py"):
+            return None
+        origin = str(Path(spec.origin).resolve())
+        if not self.handles(origin):
+            return None
+        loader = InstrumentingLoader(fullname, spec.origin, self)
+        return importlib.util.spec_from_file_location(fullname, spec.origin, loader=loader,
+                                                      submodule_search_locations=spec.submodule_search_locations)
+
+    def should_rewrite(self, origin):
+        name = os.path.basename(origin)
+        return self.rewrite and (origin in self.targets or name == "conftest.py"
+                                 or any(fnmatch.fnmatch(name, pattern) for pattern in self.python_files))
+
+    def compile(self, path, source):
+        origin = str(Path(path).resolve())
+        lines = sorted(self.targets.get(origin, ()))
+        rewrite = self.should_rewrite(origin)
+        key = hashlib.sha256(repr((source, lines, sorted(self.seed_apis), rewrite, path, pytest.__version__,
+                                   sys.version, transform_digest())).encode()).hexdigest()
+        if key in _code:
+            return _code[key]
+        cached = self.cache_dir / key[:2] / f"{key}.bin" if self.cache_dir else None
+        if cached is not None and cached.exists():
+            code = marshal.loads(cached.read_bytes())
+        else:
+            code = self.transform(path, source, lines, rewrite)
+            if cached is not None:
+                cached.parent.mkdir(parents=True, exist_ok=True)
+                tmp = cached.with_suffix(f".{os.getpid()}.tmp")
+                tmp.write_bytes(marshal.dumps(code))
+                os.replace(tmp, cached)
+        _code[key] = code
+        return code
+
+    def transform(self, path, source, lines, rewrite):
+        tree = ast.parse(source, filename=path)
+        if self.seed_apis:
+            tree = Seeder.strip_seeds(tree, self.seed_apis)
+        if lines:
+            tree = Instrumentor.Logger(lines).visit(tree)
+        ast.fix_missing_locations(tree)
+        if rewrite:
+            from _pytest.assertion.rewrite import rewrite_asserts
+            rewrite_asserts(tree, source, path, self.config)
+        return compile(tree, path, "exec", dont_inherit=True)
+
+def pytest_addoption(parser):
+    group = parser.getgroup("instrument_hook")
+    group.addoption("--instrument", action="append", default=[],
+                    help="path:line,line — record the metrics of these assertions when the module is imported")
+    group.addoption("--strip-seeds", default=None,
+                    help="Comma-separated seeding APIs whose calls are removed from modules under the rootdir")
+    group.addoption("--instrument-cache", default=os.path.join(tempfile.gettempdir(), "flaky_instrument_cache"),
+                    help="Directory for compiled instrumented modules ('' to disable)")
+
+def pytest_configure(config):
+    seed_apis = {s.strip() for s in (config.getoption("strip_seeds") or "").split(",") if s.strip()}
+    targets = parse_instrument(config.getoption("instrument"), config.invocation_params.dir)
+    if not targets and not seed_apis:
+        return
+    finder = InstrumentingFinder(config, targets, seed_apis, config.getoption("instrument_cache"))
+    sys.meta_path.insert(0, finder)
+    config.add_cleanup(lambda: sys.meta_path.remove(finder) if finder in sys.meta_path else None)
@@ -0,0 +1,143 @@
+import os
+import struct
+import tempfile
+
+import pytest
+from _pytest.runner import runtestprotocol
+
+# Side channel between instrumented tests and the sampler. Every executed
+# assertion appends one packed (left, right, param index, assertion line,
+# repetition) record to the file named by FLAKY_METRIC_FILE; the sampler reads
+# them back after the trial. The line tells apart the assertions of a
+# batch-instrumented test (-1 when the module was instrumented for a single
+# assertion). Loaded into the pytest run with `-p metric_channel`, which also
+# tags each collected item with its parametrization index (and can run a
+# subset of them). With --flaky-repeat K every selected item runs K times in
+# a row, so one session yields K trials; the repetition number tells their
+# records apart, and the function-scoped fixtures (apply_seed_config among
+# them) are set up again for each repetition. The items are re-run rather
+# than parametrized, which unittest.TestCase methods do not support.
+
+ENV_VAR = "FLAKY_METRIC_FILE"
+RECORD = struct.Struct("<ddddd")
+
+_fd = None
+_index = -1
+_rep = 0
+_indices = {}
+
+def reset():
+    global _fd, _index, _rep
+    if _fd is not None:
+        try:
+            os.close(_fd)
+        except OSError:
+            pass
+    _fd = None
+    _index = -1
+    _rep = 0
+
+def set_index(index):
+    global _index
+    _index = index
+
+def record(left, right, assertion=-1):
+    global _fd
+    if _fd is None:
+        path = os.environ.get(ENV_VAR)
+        if not path:
+            return
+        _fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+    os.write(_fd, RECORD.pack(float(left), float(right), float(_index), float(assertion), float(_rep)))
+
+def new_channel():
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+    fd, path = tempfile.mkstemp(prefix="flaky_metric_", suffix=".bin", dir=directory)
+    os.close(fd)
+    return path
+
+def read_records(path, remove=True):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    finally:
+        if remove:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    usable = len(data) - len(data) % RECORD.size
+    return list(RECORD.iter_unpack(data[:usable]))
+
+def pairs_by_index(records):
+    pairs = {}
+    for left, right, index, _, _ in records:
+        index = int(index)
+        if index in pairs:
+            raise RuntimeError("More than one metric record for parametrization", index, records)
+        pairs[index] = (left, right)
+    return pairs
+
+def pairs_by_assertion(records, default_line=-1):
+    pairs = {}
+    for left, right, index, line, _ in records:
+        key = (int(line) if line >= 0 else default_line, int(index))
+        if key in pairs:
+            raise RuntimeError("More than one metric record for assertion and parametrization", key, records)
+        pairs[key] = (left, right)
+    return pairs
+
+def records_by_rep(records, repeat):
+    # the records of a --flaky-repeat session, one list per repetition
+    reps = [[] for _ in range(repeat)]
+    for record in records:
+        rep = int(record[4])
+        if not 0 <= rep < repeat:
+            raise RuntimeError("Metric record of an unexpected repetition", rep, repeat)
+        reps[rep].append(record)
+    return reps
+
+def pytest_addoption(parser):
+    parser.addoption("--metric-indices", default=None,
+                     help="Comma-separated parametrization indices to run; the rest are deselected")
+    parser.addoption("--flaky-repeat", default=1, type=int,
+                     help="Run every selected parametrization this many times in the session")
+
+@pytest.hookimpl(trylast=True)
+def pytest_collection_modifyitems(config, items):
+    _indices.clear()
+    for index, item in enumerate(items):
+        _indices[item.nodeid] = index
+
+    selected = config.getoption("metric_indices")
+    if selected is None:
+        return
+    keep = {int(i) for i in selected.split(",") if i.strip()}
+    deselected = [item for item in items if _indices[item.nodeid] not in keep]
+    if deselected:
+        config.hook.pytest_deselected(items=deselected)
+        items[:] = [item for item in items if _indices[item.nodeid] in keep]
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_protocol(item, nextitem):
+    global _rep
+    repeat = item.config.getoption("flaky_repeat")
+    if repeat <= 1:
+        return None
+    item.ihook.pytest_runtest_logstart(nodeid=item.nodeid, location=item.location)
+    # properties added during a repetition (apply_seed_config's seed_seconds) belong to its reports only
+    properties = list(item.user_properties)
+    for rep in range(repeat):
+        _rep = rep
+        item.user_properties = list(properties)
+        # tearing down towards the item's own parent keeps the module and class fixtures between repetitions
+        runtestprotocol(item, log=True, nextitem=nextitem if rep == repeat - 1 else item.parent)
+    item.ihook.pytest_runtest_logfinish(nodeid=item.nodeid, location=item.location)
+    return True
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_runtest_setup(item):
+    set_index(_indices.get(item.nodeid, -1))
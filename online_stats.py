@@ -0,0 +1,268 @@
+import json
+import math
+import os
+
+class QuantileSketch:
+    # log-bucketed (DDSketch-style) histogram: quantiles within `relative_accuracy`, mergeable by adding counts
+    def __init__(self, relative_accuracy=0.01, min_value=1e-12):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.n = 0
+
+    def _key(self, magnitude):
+        return math.ceil(math.log(magnitude) / self.log_gamma)
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, x):
+        self.n += 1
+        if x > self.min_value:
+            key = self._key(x)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif x < -self.min_value:
+            key = self._key(-x)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zero += 1
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different accuracy", self.relative_accuracy, other.relative_accuracy)
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        self.zero += other.zero
+        self.n += other.n
+        return self
+
+    def to_dict(self):
+        return dict(relative_accuracy=self.relative_accuracy, min_value=self.min_value, zero=self.zero, n=self.n,
+                    positive=sorted(self.positive.items()), negative=sorted(self.negative.items()))
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["relative_accuracy"], data["min_value"])
+        sketch.positive = {int(k): c for k, c in data["positive"]}
+        sketch.negative = {int(k): c for k, c in data["negative"]}
+        sketch.zero, sketch.n = data["zero"], data["n"]
+        return sketch
+
+    def quantile(self, q):
+        if self.n == 0:
+            return math.nan
+        rank = q * (self.n - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+class RunningStats:
+    # Welford/Pebay streaming moments up to the fourth, plus a quantile sketch; `merge` combines two streams
+    def __init__(self, relative_accuracy=0.01):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.m3 = 0.0
+        self.m4 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, x):
+        x = float(x)
+        n1 = self.n
+        self.n += 1
+        n = self.n
+        delta = x - self.mean
+        delta_n = delta / n
+        delta_n2 = delta_n * delta_n
+        term1 = delta * delta_n * n1
+        self.mean += delta_n
+        self.m4 += term1 * delta_n2 * (n * n - 3 * n + 3) + 6 * delta_n2 * self.m2 - 4 * delta_n * self.m3
+        self.m3 += term1 * delta_n * (n - 2) - 3 * delta_n * self.m2
+        self.m2 += term1
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+        self.sketch.add(x)
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean, self.m2, self.m3, self.m4 = other.n, other.mean, other.m2, other.m3, other.m4
+            self.min, self.max = other.min, other.max
+            self.sketch.merge(other.sketch)
+            return self
+        na, nb = self.n, other.n
+        n = na + nb
+        delta = other.mean - self.mean
+        d2 = delta * delta
+        m2 = self.m2 + other.m2 + d2 * na * nb / n
+        m3 = (self.m3 + other.m3 + d2 * delta * na * nb * (na - nb) / (n * n)
+              + 3 * delta * (na * other.m2 - nb * self.m2) / n)
+        m4 = (self.m4 + other.m4 + d2 * d2 * na * nb * (na * na - na * nb + nb * nb) / (n ** 3)
+              + 6 * d2 * (na * na * other.m2 + nb * nb * self.m2) / (n * n)
+              + 4 * delta * (na * other.m3 - nb * self.m3) / n)
+        self.n, self.mean, self.m2, self.m3, self.m4 = n, self.mean + delta * nb / n, m2, m3, m4
+        self.min, self.max = min(self.min, other.min), max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+        return self
+
+    def to_dict(self):
+        # min/max are None while empty, so the JSON stays strict
+        return dict(n=self.n, mean=self.mean, m2=self.m2, m3=self.m3, m4=self.m4,
+                    min=self.min if self.n else None, max=self.max if self.n else None,
+                    sketch=self.sketch.to_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.n, stats.mean, stats.m2, stats.m3, stats.m4 = data["n"], data["mean"], data["m2"], data["m3"], data["m4"]
+        if stats.n:
+            stats.min, stats.max = data["min"], data["max"]
+        stats.sketch = QuantileSketch.from_dict(data["sketch"])
+        return stats
+
+    @property
+    def var(self):
+        return self.m2 / self.n if self.n else math.nan
+
+    @property
+    def std(self):
+        return math.sqrt(self.var) if self.n else math.nan
+
+    @property
+    def skew(self):
+        # matches scipy.stats.skew(data) (biased)
+        if self.n == 0 or self.m2 == 0:
+            return math.nan
+        return math.sqrt(self.n) * self.m3 / self.m2 ** 1.5
+
+    @property
+    def kurtosis(self):
+        # matches scipy.stats.kurtosis(data, fisher=True, bias=False)
+        n = self.n
+        if n < 4 or self.m2 == 0:
+            return math.nan
+        m2, m4 = self.m2 / n, self.m4 / n
+        return ((n * n - 1) * m4 / (m2 * m2) - 3 * (n - 1) ** 2) / ((n - 2) * (n - 3))
+
+    def quantile(self, q):
+        # the sketch is only relatively accurate, so keep the estimate inside the observed range
+        return min(max(self.sketch.quantile(q), self.min), self.max)
+
+    def tail_z(self, expected):
+        # distance from the mean to the assertion threshold, in standard deviations
+        if expected is None or self.n == 0:
+            return math.nan
+        if self.std == 0:
+            return 0.0 if expected == self.mean else math.copysign(math.inf, expected - self.mean)
+        return (expected - self.mean) / self.std
+
+    def summary(self, expected=None):
+        return dict(
+            n=self.n,
+            mean=self.mean,
+            var=self.var,
+            q25=self.quantile(0.25),
+            q75=self.quantile(0.75),
+            min=self.min,
+            max=self.max,
+            skew=self.skew,
+            kurtosis=self.kurtosis,
+            tail_z=self.tail_z(expected),
+        )
+
+def exact_quantile(ordered, q):
+    # linear interpolation between order statistics, as numpy.percentile
+    if not ordered:
+        return math.nan
+    pos = q * (len(ordered) - 1)
+    lo = math.floor(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+def converged(previous, current, tolerance):
+    # location statistics are compared in units of the spread, the spread itself relatively
+    if previous is None:
+        return False
+    scale = math.sqrt(current["var"])
+    if not scale or math.isnan(scale):
+        return all(previous[key] == current[key] for key in ("mean", "var", "q25", "q75"))
+    for key in ("mean", "q25", "q75"):
+        if abs(current[key] - previous[key]) / scale > tolerance:
+            return False
+    if abs(scale - math.sqrt(previous["var"])) / scale > tolerance:
+        return False
+    tail, prev_tail = current["tail_z"], previous["tail_z"]
+    if math.isfinite(tail) and math.isfinite(prev_tail) and abs(tail - prev_tail) > tolerance:
+        return False
+    return True
+
+def ks_2samp(a, b):
+    # two-sample Kolmogorov-Smirnov statistic and its asymptotic p-value (Stephens' small-sample correction)
+    a, b = sorted(a), sorted(b)
+    n, m = len(a), len(b)
+    if not n or not m:
+        return math.nan, math.nan
+    i = j = 0
+    d = 0.0
+    while i < n and j < m:
+        x = min(a[i], b[j])
+        while i < n and a[i] == x:
+            i += 1
+        while j < m and b[j] == x:
+            j += 1
+        d = max(d, abs(i / n - j / m))
+    en = math.sqrt(n * m / (n + m))
+    lam = (en + 0.12 + 0.11 / en) * d
+    # the alternating series converges slowly for small lambda; summed until its terms are negligible,
+    # and taken as 1 when it does not settle (as Numerical Recipes' probks)
+    p, previous = 0.0, 0.0
+    for k in range(1, 101):
+        term = 2 * (-1) ** (k - 1) * math.exp(-2 * k * k * lam * lam)
+        p += term
+        if abs(term) <= 1e-3 * previous or abs(term) <= 1e-8 * p:
+            return d, min(max(p, 0.0), 1.0)
+        previous = abs(term)
+    return d, 1.0
+
+# data/stats.json of a (test, seed config) group: the running stats of every
+# parametrization with its expected value, so summaries can be read and merged
+# across workers without the raw samples.
+STATS_FILE = "stats.json"
+
+def save_stats(path, stats, expected):
+    data = {"version": 1, "series": {str(param): {"expected": expected.get(param), **running.to_dict()}
+                                     for param, running in sorted(stats.items())}}
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def load_stats(path):
+    # (stats, expected), both keyed by the int parametrization index
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("version") != 1:
+        raise RuntimeError("Unsupported stats file version", str(path), data.get("version"))
+    stats, expected = {}, {}
+    for param, series in data["series"].items():
+        stats[int(param)] = RunningStats.from_dict(series)
+        expected[int(param)] = series["expected"]
+    return stats, expected
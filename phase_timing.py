@@ -0,0 +1,153 @@
+import argparse
+import csv
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+# Opt-in phase timing for trials. Loaded with `-p phase_timing`, the plugin
+# writes one JSON object to the file named by FLAKY_TIMING_FILE when the
+# session ends: seconds from launch to configure (interpreter start, pytest
+# and conftest imports), collection (test module imports), setup (fixtures,
+# seeding broken out from the conftest's seed_seconds), call and teardown,
+# and the process's peak RSS. The sampler adds the wall clock around it, so
+# `exit` covers interpreter shutdown and result readback.
+
+ENV_VAR = "FLAKY_TIMING_FILE"
+PHASES = ("startup", "collect", "setup", "seed", "call", "teardown", "exit", "wall")
+
+def new_file():
+    shm = "/dev/shm"
+    directory = shm if os.path.isdir(shm) and os.access(shm, os.W_OK) else None
+    fd, path = tempfile.mkstemp(prefix="flaky_timing_", suffix=".json", dir=directory)
+    os.close(fd)
+    return path
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+class PhaseTimer:
+    def __init__(self, path):
+        self.path = path
+        self.configured = time.time()
+        self.phases = {"collect": 0.0, "setup": 0.0, "seed": 0.0, "call": 0.0, "teardown": 0.0}
+
+    @pytest.hookimpl(hookwrapper=True)
+    def pytest_collection(self, session):
+        start = time.perf_counter()
+        yield
+        self.phases["collect"] += time.perf_counter() - start
+
+    def pytest_runtest_logreport(self, report):
+        self.phases[report.when] += report.duration
+        if report.when == "setup":
+            self.phases["seed"] += sum(v for k, v in report.user_properties if k == "seed_seconds")
+
+    @pytest.hookimpl(trylast=True)
+    def pytest_sessionfinish(self, session):
+        with open(self.path, "w") as f:
+            json.dump({"configured": self.configured, "finished": time.time(), "peak_rss_mb": peak_rss_mb(),
+                       **self.phases}, f)
+
+def pytest_configure(config):
+    path = os.environ.get(ENV_VAR)
+    if path:
+        config.pluginmanager.register(PhaseTimer(path), "phase_timer")
+
+def collect(path, launched, ended, remove=True):
+    # per-phase seconds of one trial; only the wall clock if pytest never got to write its part
+    timing = {"wall": ended - launched}
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        data = None
+    finally:
+        if remove:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+    if data:
+        timing["startup"] = data["configured"] - launched
+        timing["exit"] = ended - data["finished"]
+        for phase in ("collect", "setup", "seed", "call", "teardown", "peak_rss_mb"):
+            timing[phase] = data[phase]
+    return timing
+
+def summarize(timings):
+    summary = {"trials": len(timings)}
+    for phase in PHASES + ("peak_rss_mb",):
+        values = sorted(t[phase] for t in timings if phase in t)
+        if not values:
+            continue
+        p95 = values[min(len(values) - 1, int(round(0.95 * (len(values) - 1))))]
+        summary[phase] = {"mean": statistics.fmean(values), "median": statistics.median(values),
+                          "p95": p95, "max": values[-1]}
+    return summary
+
+def read_timings(path):
+    timings = []
+    with open(path) as f:
+        for line in f:
+            if line.endswith("\n"):
+                timings.append(json.loads(line))
+    return timings
+
+def write_summary(timing_path):
+    summary = summarize(read_timings(timing_path))
+    out = Path(timing_path).with_name("timing_summary.json")
+    with open(out, "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+def stat(summary, phase, key):
+    return round(summary[phase][key], 4) if phase in summary else ""
+
+def report(root, out=None):
+    # one row per <assertion>/<seed config> group, slowest first
+    rows = []
+    for path in Path(root).rglob("timing_summary.json"):
+        with open(path) as f:
+            summary = json.load(f)
+        group = path.parent.parent
+        row = {"test": str(group.parent.relative_to(root)), "seed_cfg": group.name, "trials": summary["trials"]}
+        for phase in PHASES:
+            row[f"{phase}_median"] = stat(summary, phase, "median")
+        row["wall_p95"] = stat(summary, "wall", "p95")
+        row["peak_rss_mb"] = stat(summary, "peak_rss_mb", "max")
+        rows.append(row)
+    rows.sort(key=lambda r: r["wall_median"] or 0.0, reverse=True)
+    if not rows:
+        print(f"No timing summaries under {root}")
+        return rows
+    f = open(out, "w", newline="") if out else sys.stdout
+    try:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    finally:
+        if out:
+            f.close()
+    return rows
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Phase timing CLI")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("report", help="Per-assertion timing table from a --timing run")
+    r.add_argument("--root", required=True)
+    r.add_argument("--csv-out", default=None, required=False)
+
+    args = p.parse_args()
+
+    if args.cmd == "report":
+        report(args.root, args.csv_out)
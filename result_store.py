@@ -0,0 +1,176 @@
+import argparse
+import csv
+import io
+import os
+import sys
+from array import array
+from pathlib import Path
+
+# Binary result store. Every (test, seed config) group keeps all its
+# parametrizations in one little-endian float64 file, data/values.f64, one
+# series after the other; a single index.csv at the root records where each
+# series starts and how long it is. Series can be memory mapped directly.
+
+INDEX = "index.csv"
+VALUES = "values.f64"
+COLUMNS = ["test_name", "seed_cfg", "param", "expected", "n", "offset", "file"]
+
+def to_bytes(values):
+    data = array("d", values)
+    if sys.byteorder == "big":
+        data.byteswap()
+    return data.tobytes()
+
+def from_bytes(data):
+    values = array("d")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset)
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+def _pread_write(src_fd, dst_fd, offset, count):
+    data = os.pread(src_fd, min(count, 1 << 20), offset)
+    return os.write(dst_fd, data) if data else 0
+
+def copy_range(src_fd, dst_fd, offset, count):
+    # appends count bytes of src (from offset) at dst's position, in the kernel where it can:
+    # copy_file_range, then sendfile, then through a buffer
+    for copy in (_copy_file_range, _sendfile, _pread_write):
+        try:
+            while count > 0:
+                n = copy(src_fd, dst_fd, offset, count)
+                if n == 0:
+                    raise RuntimeError("Source ended early", offset, count)
+                offset += n
+                count -= n
+            return
+        except (AttributeError, OSError):
+            if copy is _pread_write:
+                raise
+
+def replace_file(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class ResultStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.rows = {}
+        if (self.root / INDEX).exists():
+            with open(self.root / INDEX, newline="") as f:
+                for row in csv.DictReader(f):
+                    row["param"], row["n"], row["offset"] = int(row["param"]), int(row["n"]), int(row["offset"])
+                    row["expected"] = float(row["expected"])
+                    self.rows[(row["test_name"], row["seed_cfg"], row["param"])] = row
+
+    def __iter__(self):
+        return iter(sorted(self.rows.values(), key=lambda r: (r["test_name"], r["seed_cfg"], r["param"])))
+
+    def __len__(self):
+        return len(self.rows)
+
+    def groups(self):
+        out = {}
+        for row in self:
+            out.setdefault((row["test_name"], row["seed_cfg"]), []).append(row)
+        return out
+
+    def values_path(self, test_name, seed_cfg):
+        return self.root / test_name / seed_cfg / "data" / VALUES
+
+    def write_group(self, test_name, seed_cfg, values, expected, save=True):
+        path = self.values_path(test_name, seed_cfg)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for key in [k for k in self.rows if k[:2] == (test_name, seed_cfg)]:
+            del self.rows[key]
+        chunks, offset = [], 0
+        for param, series in sorted(values.items()):
+            chunks.append(to_bytes(series))
+            self.rows[(test_name, seed_cfg, param)] = dict(
+                test_name=test_name, seed_cfg=seed_cfg, param=param, expected=float(expected[param]),
+                n=len(series), offset=offset, file=str(path.relative_to(self.root)))
+            offset += len(series)
+        replace_file(path, b"".join(chunks))
+        if save:
+            self.save()
+
+    def merge_group(self, test_name, seed_cfg, sources, expected):
+        # sources: {param: [(store, row), ...]}, concatenated in that order straight from the stores' value
+        # files. Returns the new index rows instead of adding them, so groups can be merged on threads.
+        path = self.values_path(test_name, seed_cfg)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        rows, offset, files = {}, 0, {}
+        tmp = path.with_name(path.name + ".tmp")
+        try:
+            with open(tmp, "wb") as out:
+                for param, parts in sorted(sources.items()):
+                    n = 0
+                    for store, row in parts:
+                        src = store.root / row["file"]
+                        if src not in files:
+                            files[src] = os.open(src, os.O_RDONLY)
+                        copy_range(files[src], out.fileno(), row["offset"] * 8, row["n"] * 8)
+                        n += row["n"]
+                    rows[(test_name, seed_cfg, param)] = dict(
+                        test_name=test_name, seed_cfg=seed_cfg, param=param, expected=float(expected[param]),
+                        n=n, offset=offset, file=str(path.relative_to(self.root)))
+                    offset += n
+        finally:
+            for fd in files.values():
+                os.close(fd)
+        os.replace(tmp, path)
+        return rows
+
+    def save(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        out = io.StringIO()
+        writer = csv.DictWriter(out, fieldnames=COLUMNS)
+        writer.writeheader()
+        for row in self:
+            writer.writerow({**row, "expected": repr(row["expected"])})
+        replace_file(self.root / INDEX, out.getvalue().encode())
+
+    def read_bytes(self, row):
+        with open(self.root / row["file"], "rb") as f:
+            f.seek(row["offset"] * 8)
+            return f.read(row["n"] * 8)
+
+    def read(self, row):
+        return from_bytes(self.read_bytes(row))
+
+    def memmap(self, row):
+        import numpy as np
+        if row["n"] == 0:
+            return np.empty(0, dtype="<f8")
+        return np.memmap(self.root / row["file"], dtype="<f8", mode="r", offset=row["offset"] * 8, shape=(row["n"],))
+
+    def export_text(self, out_root=None):
+        out_root = Path(out_root) if out_root else self.root
+        for row in self:
+            data_path = out_root / row["test_name"] / row["seed_cfg"] / "data"
+            data_path.mkdir(parents=True, exist_ok=True)
+            with open(data_path / f"_{row['expected']}_{row['param']}.txt", "w") as f:
+                for x in self.read(row):
+                    f.write(f"{x:.10f}\n")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Result store CLI")
+    sub = p.add_subparsers(dest="cmd", required=True)
+
+    c = sub.add_parser("export", help="Write the legacy per-parametrization .txt files")
+    c.add_argument("--root", required=True, type=Path)
+    c.add_argument("--out-dir", default=None, type=Path, help="default: next to the store")
+
+    args = p.parse_args()
+    if args.cmd == "export":
+        store = ResultStore(args.root)
+        store.export_text(args.out_dir)
+        print(f"Exported {len(store)} series")